@@ -1,24 +1,62 @@
 import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
 from functools import partial, wraps
+import os
 import sys
+import threading
+import weakref
 
 if sys.version_info < (3, 10):
     from typing_extensions import ParamSpec
 else:
     from typing import ParamSpec
 
-from typing import AsyncGenerator, Awaitable, Callable, List, TypeVar
+from typing import (
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
 
 R = TypeVar("R")
 P = ParamSpec("P")
 
 
+_executor: Optional[Tuple[int, ThreadPoolExecutor]] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Executor of the blocking database calls, bounded by DB_EXECUTOR_WORKERS.
+
+    It is separate from the default executor, so the database calls do not
+    queue behind the DNS lookups and the other users of the default executor.
+    """
+    global _executor
+
+    with _executor_lock:
+        # A forked process does not inherit the threads, start a new executor
+        if _executor is None or _executor[0] != os.getpid():
+            workers = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+            _executor = (
+                os.getpid(),
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="database"),
+            )
+
+        return _executor[1]
+
+
 def run_in_executor(_func: Callable[P, R]) -> Callable[P, Awaitable[R]]:
     @wraps(_func)
     async def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
         func = partial(_func, *args, **kwargs)
         return await asyncio.get_running_loop().run_in_executor(
-            executor=None, func=func
+            executor=get_executor(), func=func
         )
 
     return wrapper
@@ -34,6 +72,97 @@ async def to_chunks(lst: List[T], n: int) -> AsyncGenerator[List[T], None]:
         yield lst[i : i + n]
 
 
+class SingleFlight:
+    """Share one in-flight call per key between the concurrent callers of an event loop"""
+
+    def __init__(self):
+        self.tasks: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, Dict[Hashable, asyncio.Task]
+        ] = weakref.WeakKeyDictionary()
+
+    def start(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> asyncio.Task:
+        """Start the call in the background, or return the one already in flight"""
+        loop = asyncio.get_running_loop()
+        tasks = self.tasks.setdefault(loop, {})
+
+        if (task := tasks.get(key)) is None:
+            task = tasks[key] = loop.create_task(func())
+            task.add_done_callback(lambda _: tasks.pop(key, None))
+            # Mark the exception as retrieved, background callers may never await it
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        return task
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        # Shield the shared task, so a cancelled caller does not cancel the others
+        return await asyncio.shield(self.start(key, func))
+
+
+async def cancel_pending_tasks():
+    """Cancel the other tasks of the running event loop and wait until they finish"""
+    current = asyncio.current_task()
+    pending = [task for task in asyncio.all_tasks() if task is not current]
+
+    for task in pending:
+        task.cancel()
+
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+class LoopThread:
+    """Event loop running forever in a daemon thread.
+
+    The coroutines submitted one after another share the loop, so the aiohttp
+    session and the background tasks started on it outlive each coroutine.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def submit(self, coro: Awaitable[T]) -> "Future[T]":
+        """Run the coroutine on the loop, start the loop on the first call"""
+        if self.thread is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(
+                target=self.__run, name=self.name, daemon=True
+            )
+            self.thread.start()
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def __run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def close(
+        self,
+        cleanup: Optional[Callable[[], Awaitable[None]]] = None,
+        timeout: float = 10.0,
+    ):
+        """Cancel the pending tasks, run the cleanup, then stop and close the loop"""
+        if self.thread is None:
+            return
+
+        async def shutdown():
+            await cancel_pending_tasks()
+
+            if cleanup:
+                await cleanup()
+
+        try:
+            self.submit(shutdown()).result(timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
+
+            if not self.thread.is_alive():
+                self.loop.close()
+
+            self.loop = self.thread = None
+
+
 # Define a function to run the async function in a new event loop
 def run_in_new_loop(async_func, *args):
     # Create a new event loop
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from datetime import datetime
+from datetime import datetime, timezone
 
 from enum import Enum
 
@@ -8,11 +8,16 @@ import os
 from pathlib import Path
 import sqlite3
 import sys
+import threading
 from argparse import ArgumentParser
+from contextlib import contextmanager
 import time
+from types import SimpleNamespace
+from typing import Optional
 
 from pymongo import DeleteOne, MongoClient, UpdateOne
 import psycopg2
+import psycopg2.extras
 import psycopg2.pool
 from psycopg2.extensions import connection
 from dotenv import load_dotenv
@@ -21,16 +26,36 @@ from dotenv import load_dotenv
 if __name__ == "__main__":
     from server import Server
     from async_utils import run_in_executor
+    from registry import ServerRegistry
 else:
     from discordgsm.server import Server
     from discordgsm.async_utils import run_in_executor
+    from discordgsm.registry import ServerRegistry
 
 load_dotenv()
 
 
 def stringify(data: dict):
-    """Dictionary to json string"""
-    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+    """Dictionary to json string, without NUL characters since PostgreSQL JSONB rejects them"""
+    text = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+    # Most results have none, only walk the data when the escape shows up
+    if "\\u0000" in text:
+        text = json.dumps(strip_nul(data), ensure_ascii=False, separators=(",", ":"))
+
+    return text
+
+
+def strip_nul(data):
+    """Remove the NUL characters from the strings and keys of the data"""
+    if isinstance(data, str):
+        return data.replace("\x00", "")
+    elif isinstance(data, dict):
+        return {strip_nul(k): strip_nul(v) for k, v in data.items()}
+    elif isinstance(data, (list, tuple)):
+        return [strip_nul(v) for v in data]
+
+    return data
 
 
 class Driver(Enum):
@@ -46,10 +71,81 @@ class InvalidDriverError(Exception):
     pass
 
 
+MIGRATIONS_LOCK_ID = 7284116
+"""PostgreSQL advisory lock held while migrating"""
+
+
+class WriterCursor(sqlite3.Cursor):
+    """Cursor of the SQLite writer connection, it holds the writer lock until released"""
+
+    lock: Optional[threading.Lock] = None
+
+    def execute(self, *args):
+        try:
+            return super().execute(*args)
+        except BaseException:
+            self.release()
+            raise
+
+    def executemany(self, *args):
+        try:
+            return super().executemany(*args)
+        except BaseException:
+            self.release()
+            raise
+
+    def executescript(self, *args):
+        try:
+            return super().executescript(*args)
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self, *, commit=False):
+        """Commit or roll back the transaction, then release the writer"""
+        if self.lock is None:
+            return
+
+        try:
+            if commit:
+                self.connection.commit()
+            elif self.connection.in_transaction:
+                self.connection.rollback()
+        finally:
+            lock, self.lock = self.lock, None
+            lock.release()
+
+
 class Database:
     """Database with connection and cursor prepared"""
 
+    summary_columns = {
+        "numplayers": "integer",
+        "numbots": "integer",
+        "maxplayers": "integer",
+        "name": "text",
+        "map": "text",
+        "ping": "integer",
+    }
+    """Columns of Server.summary(), kept in sync with the result by update_servers"""
+
     def __init__(self):
+        self.fingerprints: dict[int, tuple[int, float, bool]] = {}
+        """server id -> (fingerprint, timestamp, status) of the status and result last written"""
+        self.registry: Optional[ServerRegistry] = None
+        """In-memory servers, the reads are served from it once loaded"""
+        self.shard_ids: Optional[list[int]] = None
+        """Shards of the servers in the registry, None for all the shards"""
+        self.metrics_pruned_at = 0
+        """Timestamp of the last metrics retention pruning"""
+        self.__pid = os.getpid()
+        self.__readers = threading.local()
+        """SQLite connection of each thread, for the reads"""
+        self.__writer = SimpleNamespace(conn=None, database=None)
+        """SQLite connection shared by the writes, one at a time under the writer lock"""
+        self.__writer_lock = threading.Lock()
+        self.__connections: list[sqlite3.Connection] = []
+        self.__connections_lock = threading.Lock()
         self.connect()
 
     def __enter__(self):
@@ -102,59 +198,329 @@ class Database:
                 )
 
     def create_table_if_not_exists(self):
+        """Create the tables, then apply the pending migrations"""
+        if self.driver != Driver.MongoDB:
+            self.__create_tables()
+
+        self.migrate()
+
+    def __create_tables(self):
+        with self.transaction() as cursor:
+            if self.driver == Driver.PostgreSQL:
+                cursor.execute(
+                    """
+                CREATE TABLE IF NOT EXISTS servers (
+                    id BIGSERIAL PRIMARY KEY,
+                    position INT NOT NULL,
+                    guild_id BIGINT NOT NULL,
+                    channel_id BIGINT NOT NULL,
+                    message_id BIGINT,
+                    game_id TEXT NOT NULL,
+                    address TEXT NOT NULL,
+                    query_port INT NOT NULL,
+                    query_extra TEXT NOT NULL,
+                    status BOOLEAN NOT NULL,
+                    result TEXT NOT NULL,
+                    style_id TEXT NOT NULL,
+                    style_data TEXT NOT NULL
+                )"""
+                )
+            elif self.driver == Driver.SQLite:
+                cursor.execute(
+                    """
+                CREATE TABLE IF NOT EXISTS servers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    position INT NOT NULL,
+                    guild_id BIGINT NOT NULL,
+                    channel_id BIGINT NOT NULL,
+                    message_id BIGINT,
+                    game_id TEXT NOT NULL,
+                    address TEXT NOT NULL,
+                    query_port INT(5) NOT NULL,
+                    query_extra TEXT NOT NULL,
+                    status INT(1) NOT NULL,
+                    result TEXT NOT NULL,
+                    style_id TEXT NOT NULL,
+                    style_data TEXT NOT NULL
+                )"""
+                )
+
+    def migrations(self):
+        """Schema migrations (version, description, function), applied once in order.
+
+        Append new migrations with the next version, never edit an applied one.
+        """
+        return [
+            (1, "Create the indexes", self.__migration_create_indexes),
+            (2, "Store the JSON columns as JSONB", self.__migration_jsonb),
+            (3, "Add the summary columns", self.__migration_summary_columns),
+            (4, "Store the metrics as one record per row", self.__migration_metrics),
+            (
+                5,
+                "Make the address index not unique",
+                self.__migration_address_index_not_unique,
+            ),
+        ]
+
+    def migrate(self):
+        """Apply the migrations newer than the schema version.
+
+        Each migration can be applied again, e.g. when it failed before its version was saved.
+        On PostgreSQL the instances starting together take turns through an advisory lock.
+        """
+        if self.driver != Driver.PostgreSQL:
+            return self.__migrate()
+
+        conn, cursor = self.cursor()
+        cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRATIONS_LOCK_ID,))
+
+        try:
+            self.__migrate()
+        finally:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRATIONS_LOCK_ID,))
+            self.close(conn, cursor)
+
+    def __migrate(self):
+        # Read after the lock is taken, another instance may have just migrated
+        version = self.schema_version()
+
+        for migration_version, description, migration in self.migrations():
+            if migration_version > version:
+                print(
+                    f"Migrating database to version {migration_version}: {description}"
+                )
+                migration()
+                self.__set_schema_version(migration_version)
+
+    def schema_version(self) -> int:
         if self.driver == Driver.MongoDB:
-            return
+            migration = self.conn.get_default_database()["migrations"].find_one(
+                sort=[("_id", -1)]
+            )
+            return int(migration["_id"]) if migration else 0
 
         conn, cursor = self.cursor()
 
         if self.driver == Driver.PostgreSQL:
             cursor.execute(
                 """
-            CREATE TABLE IF NOT EXISTS servers (
-                id BIGSERIAL PRIMARY KEY,
-                position INT NOT NULL,
-                guild_id BIGINT NOT NULL,
-                channel_id BIGINT NOT NULL,
-                message_id BIGINT,
-                game_id TEXT NOT NULL,
-                address TEXT NOT NULL,
-                query_port INT NOT NULL,
-                query_extra TEXT NOT NULL,
-                status BOOLEAN NOT NULL,
-                result TEXT NOT NULL,
-                style_id TEXT NOT NULL,
-                style_data TEXT NOT NULL
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
             )"""
             )
-        elif self.driver == Driver.SQLite:
+            cursor.execute("SELECT MAX(version) FROM schema_migrations")
+        else:
+            cursor.execute("PRAGMA user_version")
+
+        row = cursor.fetchone()
+        self.close(conn, cursor, commit=True)
+
+        return int(row[0] or 0) if row else 0
+
+    def __set_schema_version(self, version: int):
+        if self.driver == Driver.MongoDB:
+            self.conn.get_default_database()["migrations"].update_one(
+                {"_id": version},
+                {"$setOnInsert": {"applied_at": datetime.utcnow()}},
+                upsert=True,
+            )
+            return
+
+        with self.transaction() as cursor:
+            if self.driver == Driver.PostgreSQL:
+                # Another instance may have applied it concurrently
+                sql = "INSERT INTO schema_migrations (version) VALUES (?) ON CONFLICT DO NOTHING"
+                cursor.execute(self.transform(sql), (version,))
+            else:
+                cursor.execute(f"PRAGMA user_version = {int(version)}")
+
+    def __migration_create_indexes(self):
+        if self.driver == Driver.MongoDB:
+            self.servers.create_index([("channel_id", 1), ("position", 1)])
+            self.servers.create_index("guild_id")
+            self.servers.create_index("message_id")
+            self.servers.create_index("game_id")
+            self.metrics.create_index("server_id")
+            # Used by __find_server, see migration 5
+            self.__migration_address_index_not_unique()
+
+            return
+
+        with self.transaction() as cursor:
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS servers_channel_id_position ON servers (channel_id, position)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS servers_guild_id ON servers (guild_id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS servers_message_id ON servers (message_id)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS servers_game_id ON servers (game_id)"
+            )
+            # Used by __find_server, not unique, /switch can move a server into a channel with the same address
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS servers_channel_id_address_query_port ON servers (channel_id, address, query_port)"
+            )
+
+    def __migration_address_index_not_unique(self):
+        """Replace the unique address index created by the first version of migration 1.
+
+        /switch can move a server into a channel monitoring the same address.
+        """
+        if self.driver == Driver.MongoDB:
+            for name, index in self.servers.index_information().items():
+                if index.get("unique") and [k for k, _ in index["key"]] == [
+                    "channel_id",
+                    "address",
+                    "query_port",
+                ]:
+                    self.servers.drop_index(name)
+
+            self.servers.create_index(
+                [("channel_id", 1), ("address", 1), ("query_port", 1)]
+            )
+            return
+
+        with self.transaction() as cursor:
+            cursor.execute("DROP INDEX IF EXISTS servers_channel_id_address_query_port")
+            cursor.execute(
+                "CREATE INDEX servers_channel_id_address_query_port ON servers (channel_id, address, query_port)"
+            )
+
+    def __migration_jsonb(self):
+        # SQLite keeps TEXT, MongoDB stores the documents as BSON already.
+        # JSONB rejects the NUL escape that TEXT stored from the query results
+        if self.driver != Driver.PostgreSQL:
+            return
+
+        with self.transaction() as cursor:
             cursor.execute(
                 """
-            CREATE TABLE IF NOT EXISTS servers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                position INT NOT NULL,
-                guild_id BIGINT NOT NULL,
-                channel_id BIGINT NOT NULL,
-                message_id BIGINT,
-                game_id TEXT NOT NULL,
-                address TEXT NOT NULL,
-                query_port INT(5) NOT NULL,
-                query_extra TEXT NOT NULL,
-                status INT(1) NOT NULL,
-                result TEXT NOT NULL,
-                style_id TEXT NOT NULL,
-                style_data TEXT NOT NULL
-            )"""
+                ALTER TABLE servers
+                    ALTER COLUMN query_extra TYPE JSONB USING replace(query_extra, '\\u0000', '')::jsonb,
+                    ALTER COLUMN result TYPE JSONB USING replace(result, '\\u0000', '')::jsonb,
+                    ALTER COLUMN style_data TYPE JSONB USING replace(style_data, '\\u0000', '')::jsonb"""
             )
 
-        self.close(conn, cursor, commit=True)
+    def __migration_summary_columns(self):
+        if self.driver != Driver.MongoDB:
+            with self.transaction() as cursor:
+                if self.driver == Driver.PostgreSQL:
+                    for column, type in self.summary_columns.items():
+                        cursor.execute(
+                            f"ALTER TABLE servers ADD COLUMN IF NOT EXISTS {column} {type.upper()}"
+                        )
+                else:
+                    # SQLite has no ADD COLUMN IF NOT EXISTS
+                    cursor.execute("PRAGMA table_info(servers)")
+                    columns = {row[1] for row in cursor.fetchall()}
+
+                    for column, type in self.summary_columns.items():
+                        if column not in columns:
+                            cursor.execute(
+                                f"ALTER TABLE servers ADD COLUMN {column} {type.upper()}"
+                            )
+
+        # Fill them from the results already stored
+        servers = self.__select_servers()
+
+        for i in range(0, len(servers), 1000):
+            self.__update_servers(servers[i : i + 1000])
+
+    def __migration_metrics(self):
+        if self.driver == Driver.MongoDB:
+            self.metrics.create_index([("server_id", 1), ("created_at", 1)])
+            self.metrics.create_index("created_at")
+
+            # Split the documents of records pushed per server
+            for doc in self.metrics.find({"records": {"$exists": True}}):
+                if records := [
+                    {
+                        "server_id": doc["server_id"],
+                        "created_at": int(
+                            record["c"].replace(tzinfo=timezone.utc).timestamp()
+                        ),
+                        "status": int(record["s"]),
+                        "players": record["p"],
+                        "bots": record["b"],
+                        "maxplayers": record["m"],
+                    }
+                    for record in doc["records"]
+                ]:
+                    self.metrics.insert_many(records, ordered=False)
+
+                self.metrics.delete_one({"_id": doc["_id"]})
+
+            return
+
+        with self.transaction() as cursor:
+            if self.driver == Driver.PostgreSQL:
+                cursor.execute(
+                    """
+                CREATE TABLE IF NOT EXISTS metrics (
+                    server_id BIGINT NOT NULL,
+                    created_at BIGINT NOT NULL,
+                    status SMALLINT NOT NULL,
+                    players INT NOT NULL,
+                    bots INT NOT NULL,
+                    maxplayers INT NOT NULL,
+                    PRIMARY KEY (server_id, created_at)
+                )"""
+                )
+            else:
+                cursor.execute(
+                    """
+                CREATE TABLE IF NOT EXISTS metrics (
+                    server_id INTEGER NOT NULL,
+                    created_at INTEGER NOT NULL,
+                    status INTEGER NOT NULL,
+                    players INTEGER NOT NULL,
+                    bots INTEGER NOT NULL,
+                    maxplayers INTEGER NOT NULL,
+                    PRIMARY KEY (server_id, created_at)
+                ) WITHOUT ROWID"""
+                )
+
+            # Used by the retention pruning
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS metrics_created_at ON metrics (created_at)"
+            )
 
     def dispose(self):
         if self.driver == Driver.PostgreSQL:
             self.pool.closeall()
         elif self.driver == Driver.MongoDB:
             self.conn.close()
+        else:
+            with self.__writer_lock, self.__connections_lock:
+                for conn in self.__connections:
+                    conn.close()
+
+                self.__connections = []
+                self.__readers = threading.local()
+                self.__writer = SimpleNamespace(conn=None, database=None)
+
+    @contextmanager
+    def transaction(self):
+        """Cursor of the writer, committed when the block exits, rolled back if it raises"""
+        conn, cursor = self.cursor(write=True)
 
-    def cursor(self):
+        try:
+            yield cursor
+        except BaseException:
+            self.close(conn, cursor)
+            raise
+
+        self.close(conn, cursor, commit=True)
+
+    def cursor(self, *, write=False):
+        """Connection and cursor, set write to run the statements on the SQLite writer.
+
+        The writer is held until close(), use transaction() to always release it.
+        """
         if self.driver == Driver.PostgreSQL:
             try:
                 conn: connection = self.pool.getconn()
@@ -171,31 +537,97 @@ class Database:
                 conn = self.pool.getconn()
                 cursor = conn.cursor()
 
+            return conn, cursor
+        elif write:
+            self.__writer_lock.acquire()
+
+            try:
+                conn = self.__sqlite_connection(write=True)
+                cursor = conn.cursor(WriterCursor)
+                cursor.lock = self.__writer_lock
+            except BaseException:
+                self.__writer_lock.release()
+                raise
+
             return conn, cursor
         else:
-            conn = sqlite3.connect(self.database)
+            conn = self.__sqlite_connection()
             cursor = conn.cursor()
             return conn, cursor
 
-    def close(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, *, commit=False):
-        cursor.close()
+    def __sqlite_connection(self, *, write=False):
+        """Reader connection of the current thread or the writer, opened once per database file"""
+        if self.__pid != os.getpid():
+            # Forked, the connections of the parent process cannot be used
+            self.__pid = os.getpid()
+            self.__readers = threading.local()
+            self.__writer = SimpleNamespace(conn=None, database=None)
+            self.__connections = []
+
+        connections = self.__writer if write else self.__readers
+        conn: Optional[sqlite3.Connection] = getattr(connections, "conn", None)
+
+        if conn is None or connections.database != self.database:
+            timeout = float(os.getenv("DB_SQLITE_BUSY_TIMEOUT", "30"))
+            cache_size = int(os.getenv("DB_SQLITE_CACHE_SIZE", "16384"))
+            conn = sqlite3.connect(
+                self.database,
+                timeout=timeout,
+                check_same_thread=False,
+                cached_statements=int(os.getenv("DB_SQLITE_CACHED_STATEMENTS", "256")),
+            )
+            # Readers do not block the writer and see the last commit
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA cache_size=-{cache_size}")
+            connections.conn = conn
+            connections.database = self.database
+
+            with self.__connections_lock:
+                self.__connections.append(conn)
 
+        return conn
+
+    def close(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, *, commit=False):
         if self.driver == Driver.PostgreSQL:
+            cursor.close()
             self.pool.putconn(conn)
+        elif isinstance(cursor, WriterCursor):
+            cursor.release(commit=commit)
+            cursor.close()
         else:
-            if commit:
-                conn.commit()
+            cursor.close()
 
-            conn.close()
+            if conn.in_transaction:
+                conn.commit() if commit else conn.rollback()
 
     def transform(self, sql: str):
         if self.driver == Driver.PostgreSQL:
-            return sql.replace("?", "%s").replace("IFNULL", "COALESCE")
+            # Escape the modulo operator from the psycopg2 placeholders
+            return (
+                sql.replace("%", "%%").replace("?", "%s").replace("IFNULL", "COALESCE")
+            )
 
         return sql  # sqlite
 
+    @run_in_executor
+    def load_registry(self, *, shard_ids: list[int] = None, shard_count: int = 1):
+        """Load the servers into memory, the reads no longer hit the database.
+
+        When shard_ids is set, only the servers of the guilds on those shards are loaded.
+        """
+        servers = self.__select_servers(shard_ids=shard_ids, shard_count=shard_count)
+        self.registry = ServerRegistry(servers)
+        self.shard_ids = shard_ids
+
+        return len(self.registry)
+
     @run_in_executor
     def statistics(self):
+        # The statistics cover all the shards
+        if self.registry is not None and self.shard_ids is None:
+            return self.registry.statistics()
+
         if self.driver == Driver.MongoDB:
             messages = len(self.servers.distinct("message_id"))
             channels = len(self.servers.distinct("channel_id"))
@@ -289,78 +721,228 @@ class Database:
         guild_id: int = None,
         message_id: int = None,
         game_id: str = None,
+        guild_ids: list[int] = None,
+        shard_ids: list[int] = None,
+        shard_count: int = 1,
         filter_secret=False,
     ):
+        """Get the servers matching all the given filters.
+
+        `guild_ids` keeps the servers of those guilds, `shard_ids` keeps the servers
+        whose guild is on those shards out of `shard_count`.
+        """
         return self.__all_servers(
             channel_id=channel_id,
             guild_id=guild_id,
             message_id=message_id,
             game_id=game_id,
+            guild_ids=guild_ids,
+            shard_ids=shard_ids,
+            shard_count=shard_count,
             filter_secret=filter_secret,
         )
 
-    def __all_servers(
-        self,
-        *,
-        channel_id: int = None,
-        guild_id: int = None,
-        message_id: int = None,
-        game_id: str = None,
-        filter_secret=False,
-    ):
+    def __all_servers(self, *, filter_secret=False, **filters):
         """Get all servers"""
+        if self.registry is None:
+            return self.__select_servers(filter_secret=filter_secret, **filters)
+
+        servers = self.registry.find(filter_secret=filter_secret, **filters)
+
+        if filter_secret and self.driver == Driver.MongoDB:
+            for server in servers:
+                server.id = str(server.id)  # Convert ObjectId to str
+
+        return servers
+
+    def __select_servers(self, *, game_id: str = None, filter_secret=False, **filters):
+        """Get all servers from the database, the filters are applied by the database"""
+        # Sorted by id when filtered by game only
+        order_by = (
+            "id"
+            if game_id
+            and not any(
+                filters.get(k) for k in ("channel_id", "guild_id", "message_id")
+            )
+            else "position"
+        )
+
         if self.driver == Driver.MongoDB:
-            if channel_id:
-                results = self.servers.find({"channel_id": channel_id}).sort("position")
-            elif guild_id:
-                results = self.servers.find({"guild_id": guild_id}).sort("position")
-            elif message_id:
-                results = self.servers.find({"message_id": message_id}).sort("position")
-            elif game_id:
-                results = self.servers.find({"game_id": game_id}).sort("position")
-            else:
-                results = self.servers.find({}).sort("position")
+            if (query := self.__query(game_id=game_id, **filters)) is None:
+                return []
 
+            results = self.servers.find(query).sort(
+                "_id" if order_by == "id" else "position"
+            )
             servers = [Server.from_docs(doc, filter_secret) for doc in results]
             results.close()
 
             return servers
 
+        if (where := self.__where(game_id=game_id, **filters)) is None:
+            return []
+
+        conditions, parameters = where
+        sql = f"SELECT * FROM servers{conditions} ORDER BY {order_by}"
+
         conn, cursor = self.cursor()
+        cursor.execute(self.transform(sql), parameters)
+        servers = [Server.from_list(row, filter_secret) for row in cursor.fetchall()]
+        self.close(conn, cursor)
 
-        if channel_id:
-            cursor.execute(
-                self.transform(
-                    "SELECT * FROM servers WHERE channel_id = ? ORDER BY position"
-                ),
-                (channel_id,),
+        return servers
+
+    def __query(
+        self,
+        *,
+        channel_id: int = None,
+        guild_id: int = None,
+        message_id: int = None,
+        game_id: str = None,
+        guild_ids: list[int] = None,
+        shard_ids: list[int] = None,
+        shard_count: int = 1,
+    ) -> Optional[dict]:
+        """MongoDB query of the filters combined, None when no server can match"""
+        query = {}
+
+        for key, value in (
+            ("channel_id", channel_id),
+            ("guild_id", guild_id),
+            ("message_id", message_id),
+            ("game_id", game_id),
+        ):
+            if value:
+                query[key] = value
+
+        if shard_ids is not None:
+            # The shard of a guild id cannot be computed exactly with the 64-bit floats of $divide
+            shard_guild_ids = [
+                id
+                for id in self.servers.distinct("guild_id")
+                if (int(id) >> 22) % max(1, shard_count) in shard_ids
+            ]
+            guild_ids = (
+                shard_guild_ids
+                if guild_ids is None
+                else list(set(guild_ids).intersection(shard_guild_ids))
             )
-        elif guild_id:
-            cursor.execute(
-                self.transform(
-                    "SELECT * FROM servers WHERE guild_id = ? ORDER BY position"
-                ),
-                (guild_id,),
+
+        if guild_ids is not None:
+            if "guild_id" not in query:
+                query["guild_id"] = {"$in": list(guild_ids)}
+            elif query["guild_id"] not in guild_ids:
+                return None
+
+        return query
+
+    def __where(
+        self,
+        *,
+        channel_id: int = None,
+        guild_id: int = None,
+        message_id: int = None,
+        game_id: str = None,
+        guild_ids: list[int] = None,
+        shard_ids: list[int] = None,
+        shard_count: int = 1,
+    ) -> Optional[tuple[str, list]]:
+        """SQL WHERE clause and parameters of the filters combined, None when no server can match"""
+        conditions: list[str] = []
+        parameters: list = []
+
+        for column, value in (
+            ("channel_id", channel_id),
+            ("guild_id", guild_id),
+            ("message_id", message_id),
+            ("game_id", game_id),
+        ):
+            if value:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+
+        if guild_ids is not None:
+            if not guild_ids:
+                return None
+
+            conditions.append(f"guild_id IN ({', '.join('?' * len(guild_ids))})")
+            parameters.extend(guild_ids)
+
+        if shard_ids is not None:
+            if not shard_ids:
+                return None
+
+            # Discord shard formula: (guild_id >> 22) % shard_count
+            conditions.append(
+                f"((guild_id >> 22) % ?) IN ({', '.join('?' * len(shard_ids))})"
             )
-        elif message_id:
-            cursor.execute(
-                self.transform(
-                    "SELECT * FROM servers WHERE message_id = ? ORDER BY position"
-                ),
-                (message_id,),
+            parameters.extend([max(1, shard_count), *shard_ids])
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        return where, parameters
+
+    @run_in_executor
+    def player_stats(self, **filters) -> dict:
+        """Number of servers, online servers, and the total players, bots and max players of the servers.
+
+        The totals are summed by the database from the summary columns, the results are not read.
+        """
+        if self.registry is not None:
+            servers = self.registry.find(**filters)
+            players, bots, maxplayers = map(
+                sum, zip((0, 0, 0), *[server.player_data() for server in servers])
             )
-        elif game_id:
-            cursor.execute(
-                self.transform("SELECT * FROM servers WHERE game_id = ? ORDER BY id"),
-                (game_id,),
+
+            return {
+                "servers": len(servers),
+                "online": sum(server.status for server in servers),
+                "players": players,
+                "bots": bots,
+                "maxplayers": maxplayers,
+            }
+
+        keys = ("servers", "online", "players", "bots", "maxplayers")
+
+        if self.driver == Driver.MongoDB:
+            if (query := self.__query(**filters)) is None:
+                return dict.fromkeys(keys, 0)
+
+            results = self.servers.aggregate(
+                [
+                    {"$match": query},
+                    {
+                        "$group": {
+                            "_id": None,
+                            "servers": {"$sum": 1},
+                            "online": {"$sum": {"$cond": ["$status", 1, 0]}},
+                            "players": {"$sum": "$numplayers"},
+                            "bots": {"$sum": "$numbots"},
+                            "maxplayers": {"$sum": "$maxplayers"},
+                        }
+                    },
+                ]
             )
-        else:
-            cursor.execute("SELECT * FROM servers ORDER BY position")
+            row = next(results, None)
+            results.close()
 
-        servers = [Server.from_list(row, filter_secret) for row in cursor.fetchall()]
+            return {key: int(row[key]) if row else 0 for key in keys}
+
+        if (where := self.__where(**filters)) is None:
+            return dict.fromkeys(keys, 0)
+
+        conditions, parameters = where
+        sql = f"""
+        SELECT COUNT(*), IFNULL(SUM(CASE WHEN status THEN 1 ELSE 0 END), 0),
+            IFNULL(SUM(numplayers), 0), IFNULL(SUM(numbots), 0), IFNULL(SUM(maxplayers), 0)
+        FROM servers{conditions}"""
+
+        conn, cursor = self.cursor()
+        cursor.execute(self.transform(sql), parameters)
+        row = cursor.fetchone()
         self.close(conn, cursor)
 
-        return servers
+        return {key: int(value) for key, value in zip(keys, row)}
 
     def server_limit(self, s: Server):
         return int(os.getenv("APP_PUBLIC_SERVER_LIMIT", "10"))
@@ -388,35 +970,46 @@ class Database:
                     "result": s.result,
                     "style_id": s.style_id,
                     "style_data": s.style_data,
+                    **s.summary(),
                 }
             )
 
-            return self.__find_server(s.channel_id, s.address, s.query_port)
+            return self.__add_to_registry(
+                self.__find_server(s.channel_id, s.address, s.query_port)
+            )
 
         sql = """
-        INSERT INTO servers (position, guild_id, channel_id, game_id, address, query_port, query_extra, status, result, style_id, style_data)
-        VALUES ((SELECT IFNULL(MAX(position + 1), 0) FROM servers WHERE channel_id = ?), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+        INSERT INTO servers (position, guild_id, channel_id, game_id, address, query_port, query_extra, status, result, style_id, style_data, numplayers, numbots, maxplayers, name, map, ping)
+        VALUES ((SELECT IFNULL(MAX(position + 1), 0) FROM servers WHERE channel_id = ?), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
 
-        conn, cursor = self.cursor()
-        cursor.execute(
-            self.transform(sql),
-            (
-                s.channel_id,
-                s.guild_id,
-                s.channel_id,
-                s.game_id,
-                s.address,
-                s.query_port,
-                stringify(s.query_extra),
-                s.status,
-                stringify(s.result),
-                s.style_id,
-                stringify(s.style_data),
-            ),
+        with self.transaction() as cursor:
+            cursor.execute(
+                self.transform(sql),
+                (
+                    s.channel_id,
+                    s.guild_id,
+                    s.channel_id,
+                    s.game_id,
+                    s.address,
+                    s.query_port,
+                    stringify(s.query_extra),
+                    s.status,
+                    stringify(s.result),
+                    s.style_id,
+                    stringify(s.style_data),
+                    *s.summary().values(),
+                ),
+            )
+
+        return self.__add_to_registry(
+            self.__find_server(s.channel_id, s.address, s.query_port)
         )
-        self.close(conn, cursor, commit=True)
 
-        return self.__find_server(s.channel_id, s.address, s.query_port)
+    def __add_to_registry(self, server: Server):
+        if self.registry is not None:
+            self.registry.put([server])
+
+        return server
 
     @run_in_executor
     def update_servers_message_id(self, servers: list[Server]):
@@ -430,26 +1023,50 @@ class Database:
 
             if operations:
                 self.servers.bulk_write(operations, ordered=False)
+        else:
+            parameters = [(server.message_id, server.id) for server in servers]
+            with self.transaction() as cursor:
+                self.__update_rows(cursor, {"message_id": "bigint"}, parameters)
 
-            return
-
-        sql = "UPDATE servers SET message_id = ? WHERE id = ?"
-        parameters = [(server.message_id, server.id) for server in servers]
-        conn, cursor = self.cursor()
-        cursor.executemany(self.transform(sql), parameters)
-        self.close(conn, cursor, commit=True)
+        if self.registry is not None:
+            self.registry.update(servers, "message_id")
 
     @run_in_executor
     def update_servers(self, servers: list[Server], *, channel_id: int = None):
         if channel_id is not None:
             return self.__update_servers_channel_id(servers, channel_id)
 
-        """Update servers status and result"""
+        """Update servers status and result, skip the servers that have not changed"""
+        changed_servers, offline_servers = self.__changed_servers(servers)
+
+        try:
+            written = self.__update_servers(changed_servers)
+            written += self.__update_servers_offline(offline_servers)
+        except Exception:
+            # Write them again on the next update
+            for server in changed_servers + offline_servers:
+                self.fingerprints.pop(server.id, None)
+
+            raise
+
+        if self.registry is not None:
+            # The unchanged servers are updated too, their ping is still fresh
+            self.registry.update(servers, "status", "result")
+
+        return written
+
+    def __update_servers(self, servers: list[Server]):
         if self.driver == Driver.MongoDB:
             operations = [
                 UpdateOne(
                     {"_id": server.id},
-                    {"$set": {"status": server.status, "result": server.result}},
+                    {
+                        "$set": {
+                            "status": server.status,
+                            "result": server.result,
+                            **server.summary(),
+                        }
+                    },
                 )
                 for server in servers
             ]
@@ -457,54 +1074,195 @@ class Database:
             if operations:
                 self.servers.bulk_write(operations, ordered=False)
 
-            return
+            return len(servers)
 
         parameters = [
-            (server.status, stringify(server.result), server.id) for server in servers
+            (
+                server.status,
+                stringify(server.result),
+                *server.summary().values(),
+                server.id,
+            )
+            for server in servers
         ]
-        sql = "UPDATE servers SET status = ?, result = ? WHERE id = ?"
-        conn, cursor = self.cursor()
-        cursor.executemany(self.transform(sql), parameters)
-        self.close(conn, cursor, commit=True)
+        columns = {"status": "boolean", "result": "jsonb", **self.summary_columns}
+        with self.transaction() as cursor:
+            self.__update_rows(cursor, columns, parameters)
 
-    @run_in_executor
-    def update_metrics(self, servers: list[Server]):
-        if os.getenv("METRICS_ENABLE", "").lower() != "true":
+        return len(servers)
+
+    def __update_rows(self, cursor, columns: dict[str, str], parameters: list[tuple]):
+        """Update the columns of the servers, parameters are the column values followed by the id.
+
+        PostgreSQL sends a page of rows per statement instead of a round-trip per row,
+        columns maps each column to its PostgreSQL type for the VALUES list.
+        """
+        if not parameters:
             return
 
-        if self.driver == Driver.MongoDB:
-            limit = int(os.getenv("METRICS_RECORD_LIMIT", "1000"))
+        if self.driver == Driver.PostgreSQL:
+            values = ", ".join(columns)
+            sql = f"UPDATE servers AS s SET {', '.join(f'{column} = v.{column}' for column in columns)} FROM (VALUES %s) AS v ({values}, id) WHERE s.id = v.id"
+            template = (
+                f"({', '.join(f'%s::{type}' for type in columns.values())}, %s::bigint)"
+            )
+            page_size = int(os.getenv("DB_PG_PAGE_SIZE", "1000"))
+            psycopg2.extras.execute_values(
+                cursor, sql, parameters, template=template, page_size=page_size
+            )
+        else:
+            sql = f"UPDATE servers SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?"
+            cursor.executemany(sql, parameters)
 
+    def __update_servers_offline(self, servers: list[Server]):
+        """Update the bookkeeping fields of the servers still offline, the rest of the result is unchanged"""
+        parameters = [
+            (
+                {
+                    k: v
+                    for k, v in server.result.get("raw", {}).items()
+                    if k.startswith("__")
+                },
+                server.id,
+            )
+            for server in servers
+        ]
+
+        if self.driver == Driver.MongoDB:
             operations = [
                 UpdateOne(
-                    {"server_id": server.id},
-                    {
-                        "$push": {
-                            "records": {
-                                "$each": [
-                                    {
-                                        "s": server.status,
-                                        "p": server.result["numplayers"]
-                                        if server.status
-                                        else 0,
-                                        "b": server.result["numbots"]
-                                        if server.status
-                                        else 0,
-                                        "m": server.result["maxplayers"],
-                                        "c": datetime.utcnow(),
-                                    }
-                                ],
-                                "$slice": limit * -1,
-                            }
-                        }
-                    },
-                    upsert=True,
+                    {"_id": id},
+                    {"$set": {f"result.raw.{k}": v for k, v in raw.items()}},
                 )
-                for server in servers
+                for raw, id in parameters
+                if raw
             ]
 
             if operations:
-                self.metrics.bulk_write(operations, ordered=False)
+                self.servers.bulk_write(operations, ordered=False)
+
+            return len(servers)
+
+        if not parameters:
+            return 0
+
+        with self.transaction() as cursor:
+            if self.driver == Driver.PostgreSQL:
+                sql = "UPDATE servers AS s SET result = jsonb_set(s.result, '{raw}', COALESCE(s.result->'raw', '{}'::jsonb) || v.raw) FROM (VALUES %s) AS v (raw, id) WHERE s.id = v.id"
+                psycopg2.extras.execute_values(
+                    cursor,
+                    sql,
+                    [(stringify(raw), id) for raw, id in parameters],
+                    template="(%s::jsonb, %s::bigint)",
+                    page_size=int(os.getenv("DB_PG_PAGE_SIZE", "1000")),
+                )
+            else:
+                sql = "UPDATE servers SET result = json_patch(result, ?) WHERE id = ?"
+                cursor.executemany(
+                    sql, [(stringify({"raw": raw}), id) for raw, id in parameters]
+                )
+
+        return len(servers)
+
+    def __changed_servers(self, servers: list[Server]):
+        """Filter the servers whose status or result changed since they were last written.
+
+        Changes in ping only are written at least every DB_UPDATE_MAX_STALENESS seconds.
+        Returns the servers to write in full and the servers still offline since their
+        last write, only the bookkeeping fields of the latter have changed.
+        """
+        now = time.time()
+        max_staleness = float(os.getenv("DB_UPDATE_MAX_STALENESS", "600"))
+        changed_servers: list[Server] = []
+        offline_servers: list[Server] = []
+
+        for server in servers:
+            fingerprint = server.fingerprint()
+            last_fingerprint, written_at, written_status = self.fingerprints.get(
+                server.id, (None, 0, None)
+            )
+
+            if fingerprint != last_fingerprint or now - written_at >= max_staleness:
+                self.fingerprints[server.id] = (fingerprint, now, server.status)
+
+                if written_status is False and not server.status:
+                    offline_servers.append(server)
+                else:
+                    changed_servers.append(server)
+
+        return changed_servers, offline_servers
+
+    @run_in_executor
+    def update_metrics(self, servers: list[Server]):
+        """Append a metrics record of each server, then prune the records older than METRICS_RETENTION"""
+        if os.getenv("METRICS_ENABLE", "").lower() != "true":
+            return
+
+        created_at = int(time.time())
+        records = []
+
+        for server in servers:
+            summary = server.summary()
+            records.append(
+                (
+                    server.id,
+                    created_at,
+                    int(server.status),
+                    int(summary["numplayers"] or 0) if server.status else 0,
+                    int(summary["numbots"] or 0) if server.status else 0,
+                    int(summary["maxplayers"] or 0),
+                )
+            )
+
+        if self.driver == Driver.MongoDB:
+            if records:
+                keys = (
+                    "server_id",
+                    "created_at",
+                    "status",
+                    "players",
+                    "bots",
+                    "maxplayers",
+                )
+                self.metrics.insert_many(
+                    [dict(zip(keys, record)) for record in records], ordered=False
+                )
+        elif records:
+            with self.transaction() as cursor:
+                if self.driver == Driver.PostgreSQL:
+                    sql = "INSERT INTO metrics (server_id, created_at, status, players, bots, maxplayers) VALUES %s ON CONFLICT DO NOTHING"
+                    psycopg2.extras.execute_values(
+                        cursor,
+                        sql,
+                        records,
+                        page_size=int(os.getenv("DB_PG_PAGE_SIZE", "1000")),
+                    )
+                else:
+                    sql = "INSERT INTO metrics (server_id, created_at, status, players, bots, maxplayers) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING"
+                    cursor.executemany(sql, records)
+
+        if created_at - self.metrics_pruned_at >= float(
+            os.getenv("METRICS_PRUNE_INTERVAL", "3600")
+        ):
+            self.metrics_pruned_at = created_at
+            self.__prune_metrics(
+                created_at - int(os.getenv("METRICS_RETENTION", str(7 * 24 * 3600)))
+            )
+
+    def __prune_metrics(self, before: int):
+        """Delete the metrics records created before the timestamp"""
+        if self.driver == Driver.MongoDB:
+            return self.metrics.delete_many(
+                {"created_at": {"$lt": before}}
+            ).deleted_count
+
+        with self.transaction() as cursor:
+            cursor.execute(
+                self.transform("DELETE FROM metrics WHERE created_at < ?"), (before,)
+            )
+            deleted = cursor.rowcount
+
+        return deleted
 
     @run_in_executor
     def delete_servers(
@@ -517,6 +1275,23 @@ class Database:
         if guild_id is None and channel_id is None and servers is None:
             return
 
+        if servers is None and self.fingerprints:
+            # The servers of the guild or the channel, their fingerprints are dropped too
+            if guild_id is not None:
+                removed = self.__all_servers(guild_id=guild_id)
+            else:
+                removed = self.__all_servers(channel_id=channel_id)
+        else:
+            removed = servers or []
+
+        for server in removed:
+            self.fingerprints.pop(server.id, None)
+
+        if self.registry is not None:
+            self.registry.remove(
+                guild_id=guild_id, channel_id=channel_id, servers=servers
+            )
+
         if self.driver == Driver.MongoDB:
             if guild_id is not None:
                 self.servers.delete_many({"guild_id": guild_id})
@@ -528,23 +1303,26 @@ class Database:
                 if operations:
                     self.servers.bulk_write(operations, ordered=False)
         else:
-            conn, cursor = self.cursor()
-
-            if guild_id is not None:
-                sql = "DELETE FROM servers WHERE guild_id = ?"
-                cursor.execute(self.transform(sql), (guild_id,))
-            elif channel_id is not None:
-                sql = "DELETE FROM servers WHERE channel_id = ?"
-                cursor.execute(self.transform(sql), (channel_id,))
-            elif servers is not None:
-                sql = "DELETE FROM servers WHERE id = ?"
-                parameters = [(server.id,) for server in servers]
-                cursor.executemany(self.transform(sql), parameters)
-
-            self.close(conn, cursor, commit=True)
+            with self.transaction() as cursor:
+                if guild_id is not None:
+                    sql = "DELETE FROM servers WHERE guild_id = ?"
+                    cursor.execute(self.transform(sql), (guild_id,))
+                elif channel_id is not None:
+                    sql = "DELETE FROM servers WHERE channel_id = ?"
+                    cursor.execute(self.transform(sql), (channel_id,))
+                elif servers is not None:
+                    sql = "DELETE FROM servers WHERE id = ?"
+                    parameters = [(server.id,) for server in servers]
+                    cursor.executemany(self.transform(sql), parameters)
 
     @run_in_executor
     def find_server(self, channel_id: int, address: str = None, query_port: int = None):
+        if self.registry is not None:
+            if server := self.registry.find_one(channel_id, address, query_port):
+                return server
+
+            raise self.ServerNotFoundError()
+
         return self.__find_server(
             channel_id=channel_id, address=address, query_port=query_port
         )
@@ -621,26 +1399,28 @@ class Database:
             )
         else:
             sql = "UPDATE servers SET position = case when position = ? then ? else ? end, message_id = case when message_id = ? then ? else ? end WHERE id IN (?, ?)"
-            conn, cursor = self.cursor()
-            cursor.execute(
-                self.transform(sql),
-                (
-                    server1.position,
-                    server2.position,
-                    server1.position,
-                    server1.message_id,
-                    server2.message_id,
-                    server1.message_id,
-                    server1.id,
-                    server2.id,
-                ),
-            )
-            self.close(conn, cursor, commit=True)
+            with self.transaction() as cursor:
+                cursor.execute(
+                    self.transform(sql),
+                    (
+                        server1.position,
+                        server2.position,
+                        server1.position,
+                        server1.message_id,
+                        server2.message_id,
+                        server1.message_id,
+                        server1.id,
+                        server2.id,
+                    ),
+                )
 
         # Swap the position and message_id values in the server objects
         server1.position, server2.position = server2.position, server1.position
         server1.message_id, server2.message_id = server2.message_id, server1.message_id
 
+        if self.registry is not None:
+            self.registry.update([server1, server2], "position", "message_id")
+
         return [server1, server2]
 
     @run_in_executor
@@ -649,12 +1429,13 @@ class Database:
             self.servers.update_one(
                 {"_id": server.id}, {"$set": {"style_id": server.style_id}}
             )
-            return
+        else:
+            sql = "UPDATE servers SET style_id = ? WHERE id = ?"
+            with self.transaction() as cursor:
+                cursor.execute(self.transform(sql), (server.style_id, server.id))
 
-        sql = "UPDATE servers SET style_id = ? WHERE id = ?"
-        conn, cursor = self.cursor()
-        cursor.execute(self.transform(sql), (server.style_id, server.id))
-        self.close(conn, cursor, commit=True)
+        if self.registry is not None:
+            self.registry.update([server], "style_id")
 
     @run_in_executor
     def update_servers_style_data(self, servers: list[Server]):
@@ -666,14 +1447,15 @@ class Database:
                 for server in servers
             ]:
                 self.servers.bulk_write(operations, ordered=False)
+        else:
+            parameters = [
+                (stringify(server.style_data), server.id) for server in servers
+            ]
+            with self.transaction() as cursor:
+                self.__update_rows(cursor, {"style_data": "jsonb"}, parameters)
 
-            return
-
-        sql = "UPDATE servers SET style_data = ? WHERE id = ?"
-        parameters = [(stringify(server.style_data), server.id) for server in servers]
-        conn, cursor = self.cursor()
-        cursor.executemany(self.transform(sql), parameters)
-        self.close(conn, cursor, commit=True)
+        if self.registry is not None:
+            self.registry.update(servers, "style_data")
 
     def __update_servers_channel_id(self, servers: list[Server], channel_id: int):
         if self.driver == Driver.MongoDB:
@@ -698,14 +1480,16 @@ class Database:
 
             if operations:
                 self.servers.bulk_write(operations, ordered=False)
+        else:
+            sql = "UPDATE servers SET channel_id = ?, position = (SELECT IFNULL(MAX(position + 1), 0) FROM servers WHERE channel_id = ?) WHERE id = ?"
+            parameters = [(channel_id, channel_id, server.id) for server in servers]
+            with self.transaction() as cursor:
+                cursor.executemany(self.transform(sql), parameters)
 
-            return
-
-        sql = "UPDATE servers SET channel_id = ?, position = (SELECT IFNULL(MAX(position + 1), 0) FROM servers WHERE channel_id = ?) WHERE id = ?"
-        parameters = [(channel_id, channel_id, server.id) for server in servers]
-        conn, cursor = self.cursor()
-        cursor.executemany(self.transform(sql), parameters)
-        self.close(conn, cursor, commit=True)
+        if self.registry is not None:
+            # The positions are assigned by the database
+            moved_servers = self.__select_servers(channel_id=channel_id)
+            self.registry.update(moved_servers, "channel_id", "position")
 
     def export(self, *, to_driver: str):
         if to_driver not in drivers:
@@ -800,17 +1584,164 @@ class Database:
                 self.create_table_if_not_exists()
 
                 # Execute the SQL commands
-                conn, cursor = self.cursor()
+                with self.transaction() as cursor:
+                    if self.driver == Driver.PostgreSQL:
+                        cursor.execute(sql_script)
+                    if self.driver == Driver.SQLite:
+                        cursor.executescript(sql_script)
 
-                if self.driver == Driver.PostgreSQL:
-                    cursor.execute(sql_script)
-                if self.driver == Driver.SQLite:
-                    cursor.executescript(sql_script)
+                print(f"Imported {len(sql_script.splitlines())} servers.")
 
-                # Commit the changes and close the cursor
-                self.close(conn, cursor, commit=True)
+    @staticmethod
+    def benchmark(rows: int, channels: int, queries=1000):
+        """Time the channel lookups of a temporary SQLite database, before and after the migrations"""
+        import random
+        import tempfile
+
+        os.environ["DB_CONNECTION"] = "sqlite"
+        os.environ["DATABASE_URL"] = ""
+
+        with tempfile.TemporaryDirectory() as directory, Database() as database:
+            database.database = os.path.join(directory, "servers.db")
+            database.__create_tables()
+
+            with database.transaction() as cursor:
+                sql = "INSERT INTO servers (position, guild_id, channel_id, game_id, address, query_port, query_extra, status, result, style_id, style_data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                cursor.executemany(
+                    sql,
+                    (
+                        (
+                            i,
+                            i % channels,
+                            i % channels,
+                            "minecraft",
+                            f"10.0.{i // 256 % 256}.{i % 256}",
+                            25565 + i // 65536,
+                            "{}",
+                            1,
+                            '{"raw":{}}',
+                            "Medium",
+                            "{}",
+                        )
+                        for i in range(rows)
+                    ),
+                )
 
-                print(f"Imported {len(sql_script.splitlines())} servers.")
+            channel_ids = [random.randrange(channels) for _ in range(queries)]
+
+            def run():
+                start = time.perf_counter()
+
+                for channel_id in channel_ids:
+                    database.__select_servers(channel_id=channel_id)
+
+                return (time.perf_counter() - start) / queries * 1000
+
+            before = run()
+            database.migrate()
+            after = run()
+
+            # Writes of the query results, as a batch and one server at a time
+            servers = database.__select_servers()[:10000]
+
+            for server in servers:
+                server.result["raw"]["benchmark"] = 1
+
+            start = time.perf_counter()
+            database.__update_servers(servers)
+            batch = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+
+            for server in servers[:queries]:
+                database.__update_servers([server])
+
+            single = (time.perf_counter() - start) / min(queries, len(servers)) * 1000
+
+        print(f"Rows = {rows}, Channels = {channels}, Queries = {queries}")
+        print(
+            f"all_servers(channel_id=...): {before:.3f} ms before, {after:.3f} ms after ({before / after:.1f}x)"
+        )
+        print(
+            f"update_servers: {batch:.1f} ms for {len(servers)} servers, {single:.3f} ms for 1 server"
+        )
+
+    @staticmethod
+    def benchmark_pg_standin(rows: int, latency: float):
+        """Count the statements update_servers sends to PostgreSQL, through a stand-in cursor.
+
+        Each statement costs `latency` seconds, like a round-trip to a remote database.
+        """
+        from psycopg2.extensions import adapt
+
+        class StandInCursor:
+            """psycopg2 cursor that counts the statements instead of sending them"""
+
+            connection = type("Connection", (), {"encoding": "UTF8"})()
+
+            def __init__(self):
+                self.statements = 0
+
+            def mogrify(self, sql: str, parameters: tuple):
+                values = [adapt(value).getquoted().decode() for value in parameters]
+                return (sql.replace("%s", "{}").format(*values)).encode()
+
+            def execute(self, sql, parameters=None):
+                self.statements += 1
+                time.sleep(latency)
+
+            def executemany(self, sql, parameters):
+                # psycopg2 sends a statement per row
+                for row in parameters:
+                    self.execute(sql, row)
+
+        os.environ["DB_CONNECTION"] = "sqlite"
+        os.environ["DATABASE_URL"] = ""
+
+        with Database() as database:
+            database.driver = Driver.PostgreSQL
+            servers = [
+                Server(
+                    id=i,
+                    position=i,
+                    guild_id=0,
+                    channel_id=0,
+                    message_id=None,
+                    game_id="minecraft",
+                    address="127.0.0.1",
+                    query_port=25565,
+                    query_extra={},
+                    status=True,
+                    result={"name": "Server", "numplayers": 1, "raw": {}},
+                    style_id="Medium",
+                    style_data={},
+                )
+                for i in range(rows)
+            ]
+
+            # Before: a statement per row
+            cursor = StandInCursor()
+            start = time.perf_counter()
+            cursor.executemany(
+                "UPDATE servers SET status = %s, result = %s WHERE id = %s",
+                [(s.status, stringify(s.result), s.id) for s in servers],
+            )
+            before = (cursor.statements, time.perf_counter() - start)
+
+            # After: update_servers through the stand-in cursor
+            cursor = StandInCursor()
+            database.cursor = lambda *, write=False: (None, cursor)
+            database.close = lambda conn, cursor, *, commit=False: None
+            start = time.perf_counter()
+            database.__update_servers(servers)
+            after = (cursor.statements, time.perf_counter() - start)
+
+            # Dispose the SQLite connections it was opened with
+            database.driver = Driver.SQLite
+
+        print(f"Rows = {rows}, Latency = {latency * 1000:.1f} ms per statement")
+        print(f"executemany: {before[0]} statements, {before[1]:.2f} seconds")
+        print(f"update_servers: {after[0]} statements, {after[1]:.2f} seconds")
 
     class ServerNotFoundError(Exception):
         pass
@@ -829,6 +1760,18 @@ if __name__ == "__main__":
     import_ = subparsers.add_parser("import")
     import_.add_argument("--filename", required=True)
 
+    benchmark = subparsers.add_parser("benchmark")
+    benchmark.add_argument("--rows", type=int, default=100000)
+    benchmark.add_argument("--channels", type=int, default=1000)
+    benchmark.add_argument(
+        "--pg-standin",
+        action="store_true",
+        help="count the statements of update_servers on a PostgreSQL stand-in cursor",
+    )
+    benchmark.add_argument(
+        "--latency", type=float, default=0.5, help="milliseconds per statement"
+    )
+
     args = parser.parse_args()
 
     if len(sys.argv) <= 1:
@@ -842,3 +1785,7 @@ if __name__ == "__main__":
         database.export(to_driver=args.to_driver)
     elif args.action == "import":
         database.import_(filename=args.filename)
+    elif args.action == "benchmark" and args.pg_standin:
+        Database.benchmark_pg_standin(rows=args.rows, latency=args.latency / 1000)
+    elif args.action == "benchmark":
+        Database.benchmark(rows=args.rows, channels=args.channels)
@@ -1,5 +1,6 @@
 import asyncio
 import csv
+import math
 import os
 import sys
 from argparse import ArgumentParser
@@ -126,27 +127,47 @@ class Gamedig:
 
         return 0 <= port_number <= 65535
 
-    async def query(self, server: Server):
+    @staticmethod
+    def query_timeout(server: Server) -> float:
+        """Derive the query timeout from the server's p95 ping, clamped between a floor and TASK_QUERY_SERVER_TIMEOUT."""
+        ceiling = float(env("TASK_QUERY_SERVER_TIMEOUT"))
+        raw = server.result.get("raw", {}) if server.result else {}
+        samples = sorted(int(ping) for ping in raw.get("__ping_samples", []))
+
+        # No history yet, or give a server that just failed the full timeout once before treating it as offline
+        if not samples or int(raw.get("__fail_query_count", "0")) == 1:
+            return ceiling
+
+        p95 = samples[max(0, math.ceil(len(samples) * 0.95) - 1)] / 1000
+        multiplier = float(os.getenv("TASK_QUERY_SERVER_TIMEOUT_MULTIPLIER", "4"))
+        floor = float(os.getenv("TASK_QUERY_SERVER_TIMEOUT_MIN", "3"))
+
+        return min(ceiling, max(floor, p95 * multiplier))
+
+    @staticmethod
+    def kv(server: Server) -> dict:
         # Backward compatibility
         if server.game_id == "forrest":
             server.game_id = "forest"
 
-        return await self.run(
-            {
-                **{
-                    "type": server.game_id,
-                    "host": server.address,
-                    "port": server.query_port,
-                },
-                **server.query_extra,
-            }
-        )
-
-    async def run(self, kv: dict) -> GamedigResult:
+        return {
+            **{
+                "type": server.game_id,
+                "host": server.address,
+                "port": server.query_port,
+            },
+            **server.query_extra,
+        }
+
+    async def query(self, server: Server):
+        return await self.run(self.kv(server), timeout=self.query_timeout(server))
+
+    async def run(self, kv: dict, *, timeout: float = None) -> GamedigResult:
         if protocol := protocols.get(self.games[kv["type"]]["protocol"]):
-            return await asyncio.wait_for(
-                protocol(kv).query(), timeout=env("TASK_QUERY_SERVER_TIMEOUT")
-            )
+            timeout = timeout or env("TASK_QUERY_SERVER_TIMEOUT")
+            instance = protocol(kv)
+            instance.timeout = timeout
+            return await asyncio.wait_for(instance.query(), timeout=timeout)
 
         raise Exception("No protocol supported")
 
@@ -3,12 +3,12 @@ from __future__ import annotations
 import asyncio
 import json
 import os
+from concurrent.futures import Future
 from datetime import datetime
 from enum import Enum
 import threading
-from typing import Optional
+from typing import Callable, Optional
 
-import aiohttp
 import discord
 from discord import (
     AutoShardedClient,
@@ -24,13 +24,16 @@ from discord import (
 from discord.ext import tasks
 from discord.ui import Button, Modal, Select, TextInput, View
 from dotenv import load_dotenv
-from discordgsm.async_utils import run_in_new_loop, to_chunks
+from discordgsm.async_utils import LoopThread
 
 from discordgsm.environment import AdvertiseType, env
-from discordgsm.gamedig import GamedigGame
+from discordgsm.gamedig import GamedigGame, GamedigResult
 from discordgsm.logger import Logger
-from discordgsm.protocols import Protocol, protocols
+from discordgsm.ratelimit import rate_limiter
+from discordgsm.resolver import resolver
+from discordgsm.scheduler import QueryPool, QueryScheduler
 from discordgsm.server import Server
+from discordgsm.sessions import close_session, get_session
 from discordgsm.service import (
     database,
     gamedig,
@@ -44,7 +47,7 @@ from discordgsm.service import (
 from discordgsm.styles import Style, Styles
 from discordgsm.translator import Translator, t
 from discordgsm.version import __version__
-from opengsq.protocol_socket import Socket
+from discordgsm.workers import QueryWorkers, pre_query_servers, query_server
 
 load_dotenv()
 
@@ -54,6 +57,9 @@ database.create_table_if_not_exists()
 messages: dict[int, Message] = {}
 """DiscordGSM messages cache"""
 
+message_fingerprints: dict[int, tuple[int, float]] = {}
+"""message id -> (fingerprint, timestamp) of the embeds last edited"""
+
 
 def cache_message(message: Message):
     """Cache the discord.Message"""
@@ -61,6 +67,30 @@ def cache_message(message: Message):
     return messages[message.id]
 
 
+class Client(AutoShardedClient):
+    async def setup_hook(self):
+        # The bot reads the servers from memory, the writes go through to the database.
+        # With APP_SHARD_IDS, each instance only loads and queries the servers of its shards.
+        count = await database.load_registry(
+            shard_ids=self.shard_ids, shard_count=self.shard_count or 1
+        )
+        shards = (
+            f"shards {self.shard_ids} of {self.shard_count}"
+            if self.shard_ids
+            else "all shards"
+        )
+        Logger.info(f"Loaded {count} servers into memory ({shards})")
+
+    async def close(self):
+        # Close the shared aiohttp session on shutdown
+        await close_session()
+        await asyncio.get_running_loop().run_in_executor(
+            None, query_loop.close, close_session
+        )
+        await asyncio.get_running_loop().run_in_executor(None, query_workers.close)
+        await super().close()
+
+
 # Client setup
 intents = discord.Intents.default()
 shard_ids = (
@@ -73,9 +103,7 @@ shard_ids = (
     else None
 )
 shard_count = int(os.getenv("APP_SHARD_COUNT", "1"))
-client = AutoShardedClient(
-    intents=intents, shard_ids=shard_ids, shard_count=shard_count
-)
+client = Client(intents=intents, shard_ids=shard_ids, shard_count=shard_count)
 
 
 # region Application event
@@ -112,14 +140,11 @@ async def on_guild_join(guild: discord.Guild):
     Logger.info(f"{client.user} joined {guild.name}({guild.id}) 🎉.")
 
     if public:
-        async with aiohttp.ClientSession() as session:
-            webhook = Webhook.from_url(
-                os.getenv("APP_PUBLIC_WEBHOOK_URL"), session=session
-            )
-            await webhook.send(
-                f"<@{client.user.id}> joined {guild.name}({guild.id}) 🎉."
-            )
-            return
+        webhook = Webhook.from_url(
+            os.getenv("APP_PUBLIC_WEBHOOK_URL"), session=get_session()
+        )
+        await webhook.send(f"<@{client.user.id}> joined {guild.name}({guild.id}) 🎉.")
+        return
 
     # Sync the commands to guild when discordgsm joins a guild.
     if guild.id in [guild.id for guild in whitelist_guilds]:
@@ -274,14 +299,14 @@ async def send_alert(server: Server, alert: Alert):
         username = "Game Server Monitor Alert"
         avatar_url = "https://avatars.githubusercontent.com/u/61296017"
 
-        async with aiohttp.ClientSession() as session:
-            webhook = Webhook.from_url(webhook_url, session=session)
-            await webhook.send(
-                content,
-                username=username,
-                avatar_url=avatar_url,
-                embed=alert_embed(server, alert),
-            )
+        webhook = Webhook.from_url(webhook_url, session=get_session())
+        await rate_limiter.wait(webhook_url)
+        await webhook.send(
+            content,
+            username=username,
+            avatar_url=avatar_url,
+            embed=alert_embed(server, alert),
+        )
     else:
         # The Webhook URL is empty.
         raise NameError()
@@ -433,11 +458,10 @@ def query_server_modal_handler(
             if public:
                 content = f"Server was added by <@{interaction.user.id}> on #{interaction.channel.name}({interaction.channel.id}) {interaction.guild.name}({interaction.guild.id})"
 
-                async with aiohttp.ClientSession() as session:
-                    webhook = Webhook.from_url(
-                        os.getenv("APP_PUBLIC_WEBHOOK_URL"), session=session
-                    )
-                    await webhook.send(content, embed=style.embed())
+                webhook = Webhook.from_url(
+                    os.getenv("APP_PUBLIC_WEBHOOK_URL"), session=get_session()
+                )
+                await webhook.send(content, embed=style.embed())
 
             server = await database.add_server(server)
             Logger.info(
@@ -570,6 +594,9 @@ async def command_refresh(interaction: Interaction):
 
     await interaction.response.defer(ephemeral=True)
 
+    # Query the servers on the next cycle even if they are not due yet
+    query_scheduler.reset(await database.all_servers(channel_id=interaction.channel.id))
+
     if await resend_channel_messages(interaction):
         await interaction.delete_original_response()
 
@@ -597,6 +624,7 @@ async def command_factoryreset(interaction: Interaction):
             channel = client.get_channel(channel_id)
 
             try:
+                await rate_limiter.wait(channel.id)
                 await channel.purge(
                     check=lambda m: m.author == client.user,
                     before=interaction.created_at,
@@ -1101,6 +1129,7 @@ async def fetch_message(server: Server):
         return None
 
     try:
+        await rate_limiter.wait(channel.id)
         message = await channel.fetch_message(server.message_id)
         return cache_message(message)
     except discord.NotFound as e:
@@ -1157,6 +1186,7 @@ async def resend_channel_messages(
     servers = await database.all_servers(channel_id=channel.id)
 
     try:
+        await rate_limiter.wait(channel.id)
         await channel.purge(
             check=lambda m: m.author == client.user,
             before=interaction.created_at if interaction else None,
@@ -1182,6 +1212,7 @@ async def resend_channel_messages(
 
     async for chunks in embeds_chunks(servers):
         try:
+            await rate_limiter.wait(channel.id)
             message = await channel.send(
                 embeds=[Styles.get(server).embed() for server in chunks]
             )
@@ -1236,118 +1267,228 @@ def group_servers_by_message_id(servers: list[Server]) -> dict[int, list[Server]
 
 
 # region Application tasks
-_tasks_query_servers_thread: Optional[threading.Thread] = None
+_tasks_query_servers_future: Optional[Future] = None
+_message_stream: Optional[MessageStream] = None
+query_loop = LoopThread("query")
+"""Event loop of the query cycles, its aiohttp session and background tasks are kept across cycles"""
 exit_signal = threading.Event()
+query_workers = QueryWorkers(int(os.getenv("TASK_QUERY_WORKERS", "0")))
+"""Query the servers in worker processes when TASK_QUERY_WORKERS > 0"""
+query_scheduler = QueryScheduler(
+    int(os.getenv("TASK_QUERY_BACKOFF_THRESHOLD", "10")),
+    int(os.getenv("TASK_QUERY_BACKOFF_MAX", "32")),
+    int(os.getenv("TASK_QUERY_IDLE_MAX", "4")),
+)
 
 
 @tasks.loop(seconds=max(15.0, env("TASK_QUERY_SERVER")))
 async def tasks_query_servers():
     """Query servers (Scheduled)"""
-    global _tasks_query_servers_thread
+    global _tasks_query_servers_future, _message_stream
 
-    if _tasks_query_servers_thread is None:
-        _tasks_query_servers_thread = threading.Thread(
-            target=run_in_new_loop, args=(__tasks_query_servers,)
+    if _tasks_query_servers_future is None:
+        # Messages are edited on this loop as soon as their servers are queried
+        _message_stream = MessageStream(asyncio.get_running_loop())
+        _tasks_query_servers_future = query_loop.submit(
+            query_servers_cycle(_message_stream)
         )
-        _tasks_query_servers_thread.start()
     else:
-        # Wait until _tasks_query_servers_thread stops
-        while _tasks_query_servers_thread.is_alive():
+        # Wait until the query cycle hands off the results, it persists them afterwards
+        while not _tasks_query_servers_future.done() and not _message_stream.ended:
             await asyncio.sleep(1)
 
-        servers = await database.all_servers()
-        await asyncio.gather(
-            tasks_send_alert(servers),
+        # Let the streamed edits finish, the messages they edited are skipped below
+        await _message_stream.join()
+
+        if _message_stream.ended:
+            servers = list(_message_stream.results.values())
+            queried_servers = [
+                server for server in servers if server.id in _message_stream.queried
+            ]
+        else:
+            # The query cycle stopped before handing off the results
+            servers = queried_servers = await database.all_servers()
+
+        alerted_servers, *_ = await asyncio.gather(
+            tasks_send_alert(queried_servers),
             tasks_edit_messages(servers),
             tasks_presence_update(tasks_query_servers.current_loop),
         )
 
-        _tasks_query_servers_thread = None
+        # Wait until the query cycle stops
+        while not _tasks_query_servers_future.done():
+            await asyncio.sleep(1)
 
+        if not _tasks_query_servers_future.cancelled() and (
+            e := _tasks_query_servers_future.exception()
+        ):
+            Logger.error(f"Query servers: Cycle failed. {type(e).__name__}: {e}")
 
-async def __tasks_query_servers():
-    Logger.debug("Query servers: Thread Started")
+        # Written after the query results, which carry the alert flags from before
+        await database.update_servers(alerted_servers)
 
-    # Pre query servers, some servers cannot be queried one by one
-    games_servers_count = await database.count_servers_per_game()
-    pre_query_tasks = [
-        pre_query(protocol({}))
-        for name, protocol in protocols.items()
-        if protocol.pre_query_required and games_servers_count.get(name, 0) > 0
-    ]
-    Logger.debug(f"Pre query servers: Tasks = {len(pre_query_tasks)}.")
-    start_time = datetime.now().timestamp()
-    pre_query_results = await asyncio.gather(*pre_query_tasks)
-    failed = sum(result is False for result in pre_query_results)
-    success = len(pre_query_results) - failed
-    percent = (
-        len(pre_query_results) > 0 and int(failed / len(pre_query_results) * 100) or 0
-    )
-    execution_time = datetime.now().timestamp() - start_time
-    Logger.debug(
-        f"Pre query servers: Total = {len(pre_query_results)}, Success = {success}, Failed = {failed} ({percent}% fail), Time used = {execution_time:.2f} seconds"
-    )
+        _tasks_query_servers_future = None
+
+
+async def query_servers_cycle(stream: Optional[MessageStream] = None):
+    Logger.debug("Query servers: Cycle Started")
 
-    # Query servers
     start_time = datetime.now().timestamp()
+    resolver.reset_stats()
     servers = await database.all_servers()
     distinct_servers = await get_distinct_servers(servers)
-    queried_servers = await query_servers(distinct_servers)
+    due = query_scheduler.due(distinct_servers, start_time, cycle_length() / 2)
+    due_servers = {key: distinct_servers[key] for key in due if key in distinct_servers}
 
-    Logger.debug(f"Update servers: Tasks = {len(queried_servers)}.")
-    await database.update_servers(queried_servers)
-    await database.update_metrics(queried_servers)
+    if stream:
+        stream.begin(servers)
+
+        # The servers not due keep their last result
+        for key, server_list in distinct_servers.items():
+            if key not in due_servers:
+                stream.done(server_list, queried=False)
+
+    # Query servers
+    await query_servers(due_servers, stream and stream.done)
+    Logger.info(
+        f"Query servers: Due = {len(due_servers)}, Skipped = {len(distinct_servers) - len(due_servers)} (not due)"
+    )
+    queried_servers: list[Server] = []
+
+    for server_list in distinct_servers.values():
+        queried_servers.extend(server_list)
+
+    if stream:
+        # Hand off the results to the bot, then persist them
+        stream.end()
+
+    written = await database.update_servers(queried_servers)
+    Logger.debug(
+        f"Update servers: Written = {written}, Skipped = {len(queried_servers) - written} (unchanged)"
+    )
+    # A record per query, the servers not due this cycle were not queried
+    await database.update_metrics(
+        [server for server_list in due_servers.values() for server in server_list]
+    )
 
     failed = sum(server.status is False for server in queried_servers)
     success = len(queried_servers) - failed
     percent = len(queried_servers) > 0 and int(failed / len(queried_servers) * 100) or 0
     execution_time = datetime.now().timestamp() - start_time
+    dns_hit_rate = int(resolver.reset_stats() * 100)
     Logger.info(
-        f"Query servers: Total = {len(queried_servers)}, Success = {success}, Failed = {failed} ({percent}% fail), Time used = {execution_time:.2f} seconds"
+        f"Query servers: Total = {len(queried_servers)}, Success = {success}, Failed = {failed} ({percent}% fail), DNS cache hit rate = {dns_hit_rate}%, Time used = {execution_time:.2f} seconds"
     )
 
 
 async def query_servers(
     distinct_servers: dict[tuple[str, str, int, str], list[Server]],
+    on_done: Optional[Callable[[list[Server]], None]] = None,
 ):
-    query_tasks = [
-        asyncio.create_task(query_distinct_server(servers))
-        for servers in distinct_servers.values()
-    ]
+    recorded: set[tuple[str, str, int, str]] = set()
+    # Scheduled from the start of the cycle, so the next due times line up with the cycles
+    cycle_start = datetime.now().timestamp()
+
+    def record(key: tuple[str, str, int, str], status: bool, result: GamedigResult):
+        servers = distinct_servers[key]
+        update_servers_result(servers, status, result)
+        query_scheduler.record(
+            key,
+            status=status,
+            base=min(query_interval(server) for server in servers),
+            now=cycle_start,
+            busy=status and int(result.get("numplayers", 0)) > 0,
+            signature=status and result_signature(result) or None,
+        )
+        recorded.add(key)
 
-    async for chunks in to_chunks(
-        query_tasks, int(os.getenv("TASK_QUERY_CHUNK_SIZE", "50"))
-    ):
-        if exit_signal.is_set():
-            Logger.debug("Exit signal received. Terminating server queries.")
-            break
+        if on_done:
+            on_done(servers)
 
-        await asyncio.gather(*chunks)
+    if query_workers.enabled:
+        start_time = datetime.now().timestamp()
+        servers = {key: servers[0] for key, servers in distinct_servers.items()}
+        await query_workers.run(servers, record, exit_signal.is_set)
+        execution_time = datetime.now().timestamp() - start_time
+        Logger.debug(
+            f"Query servers: Workers = {query_workers.processes}, Time used = {execution_time:.2f} seconds"
+        )
+    else:
+        await pre_query_servers(
+            gamedig, [servers[0] for servers in distinct_servers.values()]
+        )
+        pool = QueryPool.from_env()
 
-    servers: list[Server] = []
+        async def query(key: tuple[str, str, int, str], servers: list[Server]):
+            if exit_signal.is_set():
+                return
 
-    for server_list in distinct_servers.values():
-        servers.extend(server_list)
+            game = gamedig.games.get(servers[0].game_id)
+            protocol = game["protocol"] if game else None
+            status, result = await pool.run(
+                protocol, lambda: query_server(gamedig, servers[0])
+            )
+            record(key, status, result)
 
-    return servers
+        await asyncio.gather(
+            *[query(key, servers) for key, servers in distinct_servers.items()]
+        )
 
+        Logger.debug(
+            f"Query servers: Concurrency = {pool.concurrency}, Peak = {pool.peak_in_flight}, Utilisation = {int(pool.utilisation * 100)}%, Time used = {pool.wall_time:.2f} seconds"
+        )
 
-async def query_distinct_server(servers: list[Server]):
-    """Query server"""
-    server = servers[0]
+    if exit_signal.is_set():
+        Logger.debug("Exit signal received. Terminating server queries.")
+
+    # Query the servers without a result on the next cycle again
+    query_scheduler.release(
+        distinct_servers.keys() - recorded, datetime.now().timestamp()
+    )
+
+
+def cycle_length() -> float:
+    """Seconds between two query cycles.
+
+    tasks_query_servers starts the query thread on one tick and collects it on the next,
+    so a cycle starts every other tick.
+    """
+    return 2 * max(15.0, env("TASK_QUERY_SERVER"))
+
+
+def query_interval(server: Server) -> float:
+    """Query interval in seconds, configurable per server in style_data or per game in games.csv"""
+    cycle = cycle_length()
+    game = gamedig.games.get(server.game_id)
+    interval = server.style_data.get("query_interval") or (
+        game and game["options"].get("query_interval")
+    )
 
     try:
-        result = await gamedig.query(server)
-        status = True
-        Logger.debug(
-            f"Query servers: ({server.game_id})[{server.address}:{server.query_port}] Success. Ping: {result.get('ping', -1)}ms"
-        )
-    except Exception as e:
-        result = None
-        status = False
-        Logger.debug(
-            f"Query servers: ({server.game_id})[{server.address}:{server.query_port}] {type(e).__name__}: {e}"
-        )
+        return max(cycle, float(interval)) if interval else cycle
+    except ValueError:
+        return cycle
+
+
+def result_signature(result: GamedigResult):
+    """The fields that make a server count as changed"""
+    return tuple(
+        result.get(key)
+        for key in ("name", "map", "password", "numplayers", "numbots", "maxplayers")
+    )
+
+
+def update_servers_result(
+    servers: list[Server], status: bool, result: Optional[GamedigResult]
+):
+    """Update the status and result of the servers sharing a query"""
+    server = servers[0]
+
+    if status:
+        # Keep a rolling window of pings, used to derive the adaptive query timeout
+        ping_samples = list(server.result.get("raw", {}).get("__ping_samples", []))
+        ping_samples.append(int(result.get("ping", 0)))
+        ping_samples = ping_samples[-int(os.getenv("TASK_QUERY_PING_SAMPLES", "20")) :]
 
     for server in servers:
         # Update the status
@@ -1360,6 +1501,7 @@ async def query_distinct_server(servers: list[Server]):
             )
             server.result = result
             server.result["raw"]["__sent_offline_alert"] = sent_offline_alert
+            server.result["raw"]["__ping_samples"] = ping_samples
         else:
             raw = server.result.get("raw", {})
             server.result["raw"]["__fail_query_count"] = (
@@ -1376,7 +1518,7 @@ async def get_hash_code(server: Server):
         host = server.address
     else:
         try:
-            host = await Socket.gethostbyname(server.address)
+            host = await resolver.gethostbyname(server.address)
         except Exception as e:
             Logger.debug(
                 f"Query servers: ({server.game_id})[{server.address}:{server.query_port}] {type(e).__name__}: {e}"
@@ -1418,21 +1560,6 @@ async def get_distinct_servers(
     return distinct_dict
 
 
-async def pre_query(protocol: Protocol):
-    """Pre query"""
-    try:
-        if await asyncio.shield(protocol.pre_query()):
-            Logger.debug(f"Pre query servers: [{protocol.name}] Success.")
-            return True
-    except Exception as e:
-        Logger.debug(
-            f"Pre query servers: [{protocol.name}] Fail to query. {type(e).__name__}: {e}"
-        )
-        return False
-
-    return None
-
-
 async def tasks_send_alert(servers: list[Server]):
     """Send alerts tasks"""
 
@@ -1466,15 +1593,14 @@ async def tasks_send_alert(servers: list[Server]):
                 == fail_query_count
             )
 
-    alerted_servers = []
     tasks = [
         send_alert_webhook(server) for server in servers if should_send_alert(server)
     ]
 
-    async for chunks in to_chunks(tasks, 25):
-        alerted_servers += await asyncio.gather(*chunks)
+    # The alerted servers are persisted by the caller
+    alerted_servers: list[Server] = await asyncio.gather(*tasks)
 
-    await database.update_servers(alerted_servers)
+    return alerted_servers
 
 
 async def tasks_fetch_messages():
@@ -1484,14 +1610,7 @@ async def tasks_fetch_messages():
     start_time = datetime.now().timestamp()
 
     tasks = [fetch_message(servers[0]) for servers in grouped_servers.values()]
-    results = []
-
-    # Discord Rate limit: 50 requests per second
-    async for chunks in to_chunks(tasks, 25):
-        start = datetime.now().timestamp()
-        results += await asyncio.gather(*chunks)
-        time_used = datetime.now().timestamp() - start
-        await asyncio.sleep(max(0, 1 - time_used))
+    results = await asyncio.gather(*tasks)
 
     failed = sum(result is None for result in results)
     success = len(results) - failed
@@ -1507,40 +1626,90 @@ async def tasks_edit_messages(servers: list[Server]):
     Logger.debug(f"Edit messages: Tasks: {len(grouped_servers)} messages")
     start_time = datetime.now().timestamp()
 
-    tasks = [edit_message(servers) for servers in grouped_servers.values()]
-    results: list[bool] = []
+    tasks = []
+    skipped = 0
 
-    # Discord Rate limit: 50 requests per second
-    async for chunks in to_chunks(tasks, 25):
-        if exit_signal.is_set():
-            Logger.debug("Exit signal received. Terminating message editing tasks.")
-            break
+    for message_id, servers in grouped_servers.items():
+        if embeds := render_message(message_id, servers):
+            tasks.append(edit_message(servers, embeds))
+        else:
+            skipped += 1
 
-        start = datetime.now().timestamp()
-        results += await asyncio.gather(*chunks, return_exceptions=True)
-        time_used = datetime.now().timestamp() - start
-        await asyncio.sleep(max(0, 1 - time_used))
+    # Forget the messages that no longer exist
+    for message_id in message_fingerprints.keys() - grouped_servers.keys():
+        message_fingerprints.pop(message_id, None)
+
+    # Discord Rate limit: the edits are paced by the shared rate limiter
+    results: list[bool] = await asyncio.gather(*tasks, return_exceptions=True)
 
     failed = sum(result is False for result in results)
     success = len(results) - failed
     execution_time = datetime.now().timestamp() - start_time
     Logger.info(
-        f"Edit messages: Total = {len(results)}, Success = {success}, Failed = {failed} ({success and int(failed / len(results) * 100) or 0}% fail), Time used = {execution_time:.2f} seconds"
+        f"Edit messages: Total = {len(results)}, Success = {success}, Failed = {failed} ({success and int(failed / len(results) * 100) or 0}% fail), Skipped = {skipped} (unchanged), Time used = {execution_time:.2f} seconds"
+    )
+
+    stats = rate_limiter.reset_stats()
+    Logger.debug(
+        f"Rate limiter: Requests = {stats['requests']}, Queued = {stats['queued']}, Peak queued = {stats['peak_queued']}, Average wait = {stats['average_wait']:.2f} seconds, Max wait = {stats['max_wait']:.2f} seconds"
     )
 
 
-async def edit_message(servers: list[Server]):
+def render_message(message_id: int, servers: list[Server]) -> Optional[list[Embed]]:
+    """Render the embeds of a message, None when they are unchanged since the last edit"""
+    embeds = [Styles.get(server).embed() for server in servers]
+    fingerprint, edited_at = message_fingerprints.get(message_id, (None, 0))
+    max_staleness = float(os.getenv("TASK_EDIT_MESSAGE_MAX_STALENESS", "300"))
+
+    # Skip the messages that would render the same, except the last update time
+    if (
+        fingerprint == embeds_fingerprint(embeds)
+        and datetime.now().timestamp() - edited_at < max_staleness
+    ):
+        return None
+
+    return embeds
+
+
+def embeds_fingerprint(embeds: list[Embed]):
+    """Hash of the embeds payload, ignoring the footer text which contains the last update time"""
+    payloads = []
+
+    for embed in embeds:
+        payload = embed.to_dict()
+
+        if footer := payload.get("footer"):
+            payload["footer"] = {k: v for k, v in footer.items() if k != "text"}
+
+        payloads.append(payload)
+
+    return hash(json.dumps(payloads, sort_keys=True, default=str))
+
+
+async def edit_message(servers: list[Server], embeds: Optional[list[Embed]] = None):
     """Edit message"""
     if len(servers) <= 0:
         return True
 
     if message := await fetch_message(servers[0]):
         try:
-            embeds = [Styles.get(server).embed() for server in servers]
+            if embeds is None:
+                embeds = [Styles.get(server).embed() for server in servers]
+
+            await rate_limiter.wait(message.channel.id)
+
+            if exit_signal.is_set():
+                Logger.debug(f"Edit messages: {message.id} exit signal received")
+                return False
+
             message = await asyncio.wait_for(
                 message.edit(embeds=embeds),
                 timeout=float(os.getenv("TASK_EDIT_MESSAGE_TIMEOUT", "3")),
             )
+            message_fingerprints[message.id] = (
+                embeds_fingerprint(embeds),
+                datetime.now().timestamp(),
+            )
             Logger.debug(f"Edit messages: {message.id} success")
             return True
         except discord.Forbidden as e:
@@ -1564,6 +1733,118 @@ async def edit_message(servers: list[Server]):
     return False
 
 
+class MessageStream:
+    """Edit the messages as soon as all of their servers have been queried.
+
+    The query thread publishes the servers with `begin`, `done` and `end`, the
+    messages are rendered and edited on the event loop of the bot. The results
+    are handed off to the bot without a database round-trip.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.pending: dict[int, set[int]] = {}
+        """message id -> ids of the servers not queried yet"""
+        self.servers: dict[int, dict[int, Server]] = {}
+        """message id -> server id -> server"""
+        self.results: dict[int, Server] = {}
+        """server id -> server, in the order of the positions"""
+        self.queried: set[int] = set()
+        """ids of the servers queried in this cycle"""
+        self.ended = False
+        self.tasks: set[asyncio.Task] = set()
+        self.edited = 0
+        self.skipped = 0
+        self.max_latency = 0.0
+
+    def begin(self, servers: list[Server]):
+        """Start a query cycle, called from the query thread"""
+        self.__call_soon(self.__begin, self.copy(servers))
+
+    def done(self, servers: list[Server], *, queried=True):
+        """The servers have been queried or are not due, called from the query thread"""
+        self.__call_soon(
+            self.__done, self.copy(servers), datetime.now().timestamp(), queried
+        )
+
+    def end(self):
+        """All the servers are done, called from the query thread"""
+        self.__call_soon(self.__end)
+
+    @staticmethod
+    def copy(servers: list[Server]):
+        # The query thread keeps updating its own servers
+        return [server.copy() for server in servers]
+
+    def __call_soon(self, callback: Callable, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # The event loop of the bot is closed
+            pass
+
+    def __begin(self, servers: list[Server]):
+        self.pending.clear()
+        self.servers.clear()
+        self.results = {server.id: server for server in servers}
+        self.queried.clear()
+        self.ended = False
+        # The stats logged by join() are per cycle
+        self.edited = 0
+        self.skipped = 0
+        self.max_latency = 0.0
+
+        for message_id, server_list in group_servers_by_message_id(servers).items():
+            self.pending[message_id] = {server.id for server in server_list}
+            self.servers[message_id] = {server.id: server for server in server_list}
+
+    def __done(self, servers: list[Server], queried_at: float, queried: bool):
+        for server in servers:
+            self.results[server.id] = server
+
+            if queried:
+                self.queried.add(server.id)
+
+            if (pending := self.pending.get(server.message_id)) is None:
+                continue
+
+            self.servers[server.message_id][server.id] = server
+            pending.discard(server.id)
+
+            if not pending:
+                del self.pending[server.message_id]
+                server_list = list(self.servers.pop(server.message_id).values())
+                task = asyncio.create_task(
+                    self.__edit(server.message_id, server_list, queried_at)
+                )
+                self.tasks.add(task)
+                task.add_done_callback(self.tasks.discard)
+
+    def __end(self):
+        self.ended = True
+
+    async def __edit(self, message_id: int, servers: list[Server], queried_at: float):
+        if exit_signal.is_set():
+            return
+
+        try:
+            if not (embeds := render_message(message_id, servers)):
+                self.skipped += 1
+            elif await edit_message(servers, embeds):
+                self.edited += 1
+                latency = datetime.now().timestamp() - queried_at
+                self.max_latency = max(self.max_latency, latency)
+        except Exception as e:
+            Logger.debug(f"Stream messages: {message_id} {type(e).__name__}: {e}")
+
+    async def join(self):
+        """Wait for the edits in progress"""
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        Logger.info(
+            f"Stream messages: Edited = {self.edited}, Skipped = {self.skipped} (unchanged), Pending = {len(self.pending)}, Max latency = {self.max_latency:.2f} seconds"
+        )
+
+
 async def tasks_presence_update(current_loop: int):
     """Presence update tasks"""
     name = None
@@ -1591,17 +1872,18 @@ async def tasks_presence_update(current_loop: int):
                     )
         elif advertise_type == AdvertiseType.player_stats:
             # Display servers players stats
-            if servers := await database.all_servers():
-                players, bots, maxplayers = map(
-                    sum, zip(*[Style.get_player_data(server) for server in servers])
+            stats = await database.player_stats()
+
+            if stats["servers"] > 0:
+                name = Style.to_players_string(
+                    stats["players"], stats["bots"], stats["maxplayers"]
                 )
-                name = Style.to_players_string(players, bots, maxplayers)
 
                 # Sync bot status to server status when one server only
-                if len(servers) == 1:
+                if stats["servers"] == 1:
                     status = (
                         discord.Status.online
-                        if servers[0].status
+                        if stats["online"]
                         else discord.Status.do_not_disturb
                     )
 
@@ -1644,9 +1926,8 @@ async def heroku_query():
     url = f"https://{os.environ['HEROKU_APP_NAME']}.herokuapp.com"
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, raise_for_status=True) as _:
-                Logger.debug(f"Sends a GET request to {url}")
+        async with get_session().get(url, raise_for_status=True) as _:
+            Logger.debug(f"Sends a GET request to {url}")
     except Exception as e:
         Logger.error(
             f"Fail to send a GET request to {url}, {e}, your discord bot will sleeps after 30 minutes of inactivity."
@@ -1,9 +1,12 @@
+import base64
+import os
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
 import aiohttp
 import opengsq
 
+from discordgsm.async_utils import SingleFlight
 from discordgsm.protocols.protocol import Protocol
 
 if TYPE_CHECKING:
@@ -21,28 +24,173 @@ class ASA(Protocol):
     _external_auth_type = ""
     _external_auth_token = ""
     _access_token = ""
+    _access_token_expires_at = 0.0
+    _eos = SingleFlight()
 
-    async def pre_query(self):
-        ASA._access_token = await opengsq.EOS.get_access_token(
-            client_id=self._client_id,
-            client_secret=self._client_secret,
-            deployment_id=self._deployment_id,
-            grant_type=self._grant_type,
-            external_auth_type=self._external_auth_type,
-            external_auth_token=self._external_auth_token,
+    _battlemetrics_game_codes = ["arksa", "ark"]
+    _battlemetrics = SingleFlight()
+    _battlemetrics_index: dict[tuple[str, int], dict] = {}
+    """(ip, port) and (ip, portQuery) -> BattleMetrics server"""
+    _battlemetrics_expiry = 0.0
+    _battlemetrics_searches: dict[tuple[str, int], tuple[float, Optional[dict]]] = {}
+    """(host, port) -> (expiry, BattleMetrics server or None), for the servers missing in the index"""
+
+    @property
+    def battlemetrics_ttl(self):
+        return float(os.getenv("BATTLEMETRICS_CACHE_TTL", "300"))
+
+    async def pre_query(self, kvs: Optional[list[dict]] = None):
+        await self.access_token()
+
+    async def access_token(self) -> str:
+        """EOS access token, cached until it expires and refreshed shortly before"""
+        remaining = ASA._access_token_expires_at - time.time()
+
+        if ASA._access_token and remaining > 0:
+            if remaining < float(os.getenv("EOS_TOKEN_REFRESH_MARGIN", "300")):
+                # Still valid, refresh it in the background
+                ASA._eos.start("access_token", self.fetch_access_token)
+
+            return ASA._access_token
+
+        return await ASA._eos.run("access_token", self.fetch_access_token)
+
+    async def fetch_access_token(self) -> str:
+        url = "https://api.epicgames.dev/auth/v1/oauth/token"
+        data = "&".join(
+            [
+                f"grant_type={self._grant_type}",
+                f"external_auth_type={self._external_auth_type}",
+                f"external_auth_token={self._external_auth_token}",
+                "nonce=opengsq",
+                f"deployment_id={self._deployment_id}",
+                "display_name=User",
+            ]
         )
+        credentials = f"{self._client_id}:{self._client_secret}".encode("utf-8")
+        headers = {
+            "Authorization": f"Basic {base64.b64encode(credentials).decode('utf-8')}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
 
-    async def query(self):
-        if not ASA._access_token:
-            await self.pre_query()
+        async with self.session.post(url, data=data, headers=headers) as response:
+            response.raise_for_status()
+            data = await response.json()
+
+        ASA._access_token = data["access_token"]
+        ASA._access_token_expires_at = time.time() + int(data.get("expires_in", 600))
+
+        return ASA._access_token
+
+    async def battlemetrics_lookup(self, host: str, port: int) -> Optional[dict]:
+        """Find the server in the shared BattleMetrics index, fallback to a search cached per address"""
+        now = time.time()
+
+        if now >= ASA._battlemetrics_expiry:
+            try:
+                await ASA._battlemetrics.run("index", self.battlemetrics_index)
+            except Exception:
+                # Do not retry the index on every query while BattleMetrics is unavailable
+                ASA._battlemetrics_expiry = now + min(60.0, self.battlemetrics_ttl)
+
+        if server := ASA._battlemetrics_index.get((host, port)):
+            return server
+
+        expiry, server = ASA._battlemetrics_searches.get((host, port), (0.0, None))
+
+        if now >= expiry:
+            server = await ASA._battlemetrics.run(
+                (host, port), lambda: self.battlemetrics_search(host, port)
+            )
+            ASA._battlemetrics_searches[(host, port)] = (
+                now + self.battlemetrics_ttl,
+                server,
+            )
+
+        return server
+
+    async def battlemetrics_index(self):
+        """Page through the BattleMetrics servers once, indexed by (ip, port) and (ip, portQuery)"""
+        index: dict[tuple[str, int], dict] = {}
+        per_page, max_pages = 100, 5
+
+        for game_code in self._battlemetrics_game_codes:
+            for page in range(1, max_pages + 1):
+                url = (
+                    f"https://api.battlemetrics.com/servers?filter[game]={game_code}"
+                    f"&page[size]={per_page}&page[number]={page}"
+                )
 
+                async with self.session.get(
+                    url, timeout=aiohttp.ClientTimeout(total=self.timeout)
+                ) as response:
+                    if response.status != 200:
+                        break
+
+                    data = await response.json()
+
+                servers = data.get("data", [])
+
+                for server in servers:
+                    attrs = server.get("attributes", {})
+
+                    for key in ("port", "portQuery"):
+                        if attrs.get(key) is not None:
+                            index.setdefault((attrs.get("ip"), attrs.get(key)), server)
+
+                total_pages = (
+                    data.get("meta", {}).get("pagination", {}).get("totalPages")
+                )
+
+                if not servers or total_pages is None or page >= total_pages:
+                    break
+
+        ASA._battlemetrics_index = index
+        ASA._battlemetrics_expiry = time.time() + self.battlemetrics_ttl
+        ASA._battlemetrics_searches = {
+            k: v for k, v in ASA._battlemetrics_searches.items() if v[0] > time.time()
+        }
+
+    async def battlemetrics_search(self, host: str, port: int) -> Optional[dict]:
+        """Fuzzy search the address for the servers missing in the index"""
+        for game_code in self._battlemetrics_game_codes:
+            url = (
+                f"https://api.battlemetrics.com/servers?filter[game]={game_code}"
+                f"&filter[search]={host}:{port}&page[size]=100"
+            )
+
+            try:
+                async with self.session.get(
+                    url, timeout=aiohttp.ClientTimeout(total=self.timeout)
+                ) as response:
+                    if response.status != 200:
+                        continue
+
+                    data = await response.json()
+            except Exception:
+                continue
+
+            # Check for exact match in fuzzy results
+            for server in data.get("data", []):
+                attrs = server.get("attributes", {})
+
+                if attrs.get("ip") == host and port in (
+                    attrs.get("port"),
+                    attrs.get("portQuery"),
+                ):
+                    return server
+
+        return None
+
+    async def query(self):
+        access_token = await self.access_token()
         host, port = str(self.kv["host"]), int(str(self.kv["port"]))
         start = time.time()
 
         # Try EOS first
         try:
             eos = opengsq.EOS(
-                host, port, self._deployment_id, ASA._access_token, self.timeout
+                host, port, self._deployment_id, access_token, self.timeout
             )
             info = await eos.get_info()
             ping = int((time.time() - start) * 1000)
@@ -68,82 +216,9 @@ class ASA(Protocol):
             # EOS failed, fallback to BattleMetrics
             start = time.time()  # Restart timer for BattleMetrics query
 
-        # Fallback: Query BattleMetrics API with multi-stage strategy
-        # Stage 1: Direct fuzzy search with exact IP:port verification
-        # Stage 2: Pagination search by game filter only
-        # Stage 3: Retry with alternative game codes
-        
-        async def battlemetrics_lookup(game_codes=None):
-            """
-            Multi-stage BattleMetrics lookup with exact IP:port matching.
-            Returns server info dict or None if not found.
-            """
-            if game_codes is None:
-                game_codes = ["arksa", "ark"]
-            
-            async with aiohttp.ClientSession() as session:
-                for game_code in game_codes:
-                    # Stage 1: Direct fuzzy search
-                    try:
-                        url = (
-                            f"https://api.battlemetrics.com/servers?filter[game]={game_code}"
-                            f"&filter[search]={host}:{port}&page[size]=100"
-                        )
-                        async with session.get(url, timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
-                            if response.status == 200:
-                                data = await response.json()
-                                servers = data.get("data", [])
-                                
-                                # Check for exact match in fuzzy results
-                                for server in servers:
-                                    attrs = server.get("attributes", {})
-                                    if (attrs.get("ip") == host and 
-                                        (attrs.get("port") == port or attrs.get("portQuery") == port)):
-                                        return server
-                    except Exception:
-                        pass
-                    
-                    # Stage 2: Pagination search by game filter only (more reliable for exact matches)
-                    try:
-                        page = 1
-                        per_page = 100
-                        max_pages = 5
-                        
-                        while page <= max_pages:
-                            url = (
-                                f"https://api.battlemetrics.com/servers?filter[game]={game_code}"
-                                f"&page[size]={per_page}&page[number]={page}"
-                            )
-                            async with session.get(url, timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
-                                if response.status != 200:
-                                    break
-                                
-                                data = await response.json()
-                                servers = data.get("data", [])
-                                
-                                if not servers:
-                                    break
-                                
-                                # Look for exact match
-                                for server in servers:
-                                    attrs = server.get("attributes", {})
-                                    if (attrs.get("ip") == host and 
-                                        attrs.get("port") == port):
-                                        return server
-                                
-                                # Check if there are more pages
-                                meta = data.get("meta", {})
-                                pagination = meta.get("pagination", {})
-                                total_pages = pagination.get("totalPages")
-                                if total_pages is None or page >= total_pages:
-                                    break
-                                page += 1
-                    except Exception:
-                        continue
-            
-            return None
-        
-        server_info = await battlemetrics_lookup()
+        # Fallback: Look up the server on BattleMetrics
+        server_info = await self.battlemetrics_lookup(host, port)
+
         if not server_info:
             raise Exception(f"No server found on BattleMetrics for {host}:{port}")
 
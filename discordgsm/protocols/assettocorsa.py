@@ -2,8 +2,6 @@ import asyncio
 import time
 from typing import TYPE_CHECKING
 
-import aiohttp
-
 from discordgsm.protocols.protocol import Protocol
 
 if TYPE_CHECKING:
@@ -44,14 +42,12 @@ class AssettoCorsa(Protocol):
         host, port = str(self.kv["host"]), int(str(self.kv["port"]))
         url = f"http://{host}:{port}/INFO?v={int(time.time())}"
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                return await response.json(content_type=None)
+        async with self.session.get(url) as response:
+            return await response.json(content_type=None)
 
     async def query_json(self):
         host, port = str(self.kv["host"]), int(str(self.kv["port"]))
         url = f"http://{host}:{port}/JSON|{int(time.time())}"
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                return await response.json(content_type=None)
+        async with self.session.get(url) as response:
+            return await response.json(content_type=None)
@@ -1,10 +1,8 @@
 import re
-from typing import TYPE_CHECKING
-
-import aiohttp
-from opengsq.protocol_socket import Socket
+from typing import TYPE_CHECKING, Optional
 
 from discordgsm.protocols.protocol import Protocol
+from discordgsm.resolver import resolver
 
 if TYPE_CHECKING:
     from discordgsm.gamedig import GamedigResult
@@ -15,13 +13,12 @@ class BeamMP(Protocol):
     name = "beammp"
     master_servers = None
 
-    async def pre_query(self):
+    async def pre_query(self, kvs: Optional[list[dict]] = None):
         url = "https://backend.beammp.com/servers-info"
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                servers: dict = await response.json()
+        async with self.session.get(url) as response:
+            response.raise_for_status()
+            servers: dict = await response.json()
 
         BeamMP.master_servers = {f"{s['ip']}:{s['port']}": s for s in servers}
 
@@ -30,7 +27,7 @@ class BeamMP(Protocol):
             await self.pre_query()
 
         host, port = str(self.kv["host"]), int(str(self.kv["port"]))
-        ip = await Socket.gethostbyname(host)
+        ip = await resolver.gethostbyname(host)
         key = f"{ip}:{port}"
 
         if key not in BeamMP.master_servers:
@@ -1,8 +1,6 @@
 import time
 from typing import TYPE_CHECKING
 
-import aiohttp
-
 from discordgsm.protocols.protocol import Protocol
 
 if TYPE_CHECKING:
@@ -17,10 +15,9 @@ class Discord(Protocol):
         url = f"https://discord.com/api/guilds/{guild_id}/widget.json?v={int(time.time())}"
         start = time.time()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                data = await response.json()
-                ping = int((time.time() - start) * 1000)
+        async with self.session.get(url) as response:
+            data = await response.json()
+            ping = int((time.time() - start) * 1000)
 
         result: GamedigResult = {
             "name": data["name"],
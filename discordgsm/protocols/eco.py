@@ -2,8 +2,6 @@ import re
 import time
 from typing import TYPE_CHECKING
 
-import aiohttp
-
 from discordgsm.protocols.protocol import Protocol
 
 if TYPE_CHECKING:
@@ -18,10 +16,9 @@ class Eco(Protocol):
         url = f"http://{host}:{port}/info"
         start = time.time()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                data = await response.json()
-                ping = int((time.time() - start) * 1000)
+        async with self.session.get(url) as response:
+            data = await response.json()
+            ping = int((time.time() - start) * 1000)
 
         name = re.sub(
             r"<color=\w*>|<(color=)?#[0-9a-fA-F]{6}>|<\/color>", "", data["Description"]
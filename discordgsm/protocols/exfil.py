@@ -21,16 +21,15 @@ class Exfil(Protocol):
 
         # Stage 1: Try HTTP API first
         try:
-            async with aiohttp.ClientSession() as session:
-                api_url = f"http://{host}:{port}/status"
-                async with session.get(api_url, timeout=aiohttp.ClientTimeout(total=3)) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if isinstance(data, dict):
-                            result = await self._build_result_from_api(data, host, port, start, time.time())
-                            return result
-                    else:
-                        pass
+            api_url = f"http://{host}:{port}/status"
+            async with self.session.get(api_url, timeout=aiohttp.ClientTimeout(total=3)) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if isinstance(data, dict):
+                        result = await self._build_result_from_api(data, host, port, start, time.time())
+                        return result
+                else:
+                    pass
         except asyncio.TimeoutError:
             pass
         except Exception:
@@ -1,11 +1,9 @@
 import re
-from typing import TYPE_CHECKING
-
-import aiohttp
-from opengsq.protocol_socket import Socket
+from typing import TYPE_CHECKING, Optional
 
 from discordgsm.environment import env
 from discordgsm.protocols.protocol import Protocol
+from discordgsm.resolver import resolver
 
 if TYPE_CHECKING:
     from discordgsm.gamedig import GamedigResult
@@ -29,15 +27,14 @@ class Factorio(Protocol):
         if self.username and self.token:
             Factorio.pre_query_required = True
 
-    async def pre_query(self):
+    async def pre_query(self, kvs: Optional[list[dict]] = None):
         if not Factorio.pre_query_required:
             return
 
         url = f"https://multiplayer.factorio.com/get-games?username={self.username}&token={self.token}"
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                servers = await response.json()
+        async with self.session.get(url) as response:
+            servers = await response.json()
 
         if "message" in servers:
             # Possible error messages
@@ -58,7 +55,7 @@ class Factorio(Protocol):
             await self.pre_query()
 
         host, port = str(self.kv["host"]), int(str(self.kv["port"]))
-        ip = await Socket.gethostbyname(host)
+        ip = await resolver.gethostbyname(host)
         host_address = f"{ip}:{port}"
 
         if host_address not in Factorio.master_servers:
@@ -2,7 +2,6 @@ import asyncio
 import time
 from typing import TYPE_CHECKING
 
-import aiohttp
 import opengsq
 
 from discordgsm.protocols.protocol import Protocol
@@ -43,14 +42,12 @@ class FiveM(Protocol):
         host, port = str(self.kv["host"]), int(str(self.kv["port"]))
         url = f"http://{host}:{port}/info.json?v={int(time.time())}"
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                return await response.json(content_type=None)
+        async with self.session.get(url) as response:
+            return await response.json(content_type=None)
 
     async def query_players(self):
         host, port = str(self.kv["host"]), int(str(self.kv["port"]))
         url = f"http://{host}:{port}/players.json?v={int(time.time())}"
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                return await response.json(content_type=None)
+        async with self.session.get(url) as response:
+            return await response.json(content_type=None)
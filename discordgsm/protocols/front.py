@@ -1,11 +1,11 @@
 import asyncio
 import json
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
-import aiohttp
 import opengsq
-from opengsq.protocol_socket import Socket
+
+from discordgsm.resolver import resolver
 
 if __name__ == "__main__":
     from protocol import Protocol
@@ -21,12 +21,11 @@ class Front(Protocol):
     name = "front"
     master_servers = None
 
-    async def pre_query(self):
+    async def pre_query(self, kvs: Optional[list[dict]] = None):
         url = "https://privatelist.playthefront.com/private_list"
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                res = await response.json(content_type=None)
+        async with self.session.get(url) as response:
+            res = await response.json(content_type=None)
 
         if res["msg"] != "ok":
             raise LookupError(res["msg"])
@@ -65,7 +64,7 @@ class Front(Protocol):
             await self.pre_query()
 
         host, port = str(self.kv["host"]), int(str(self.kv["port"]))
-        ip = await Socket.gethostbyname(host)
+        ip = await resolver.gethostbyname(host)
         key = f"{ip}:{port}"
 
         data: dict = Front.master_servers[key]
@@ -1,5 +1,7 @@
+import asyncio
+import os
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional, Union
 
 import aiohttp
 
@@ -10,21 +12,65 @@ if TYPE_CHECKING:
 
 
 class GPortal(Protocol):
+    pre_query_required = True
     name = "gportal"
 
+    results: dict[str, tuple[float, Union[tuple[dict, int], Exception]]] = {}
+    """serverId -> (fetched at, (data, ping) or the exception raised)"""
+
+    @property
+    def cache_ttl(self):
+        return max(15.0, float(os.getenv("TASK_QUERY_SERVER", "60")))
+
+    async def pre_query(self, kvs: Optional[list[dict]] = None):
+        # Servers sharing a serverId across guilds are fetched once
+        server_ids = {str(kv["serverId"]) for kv in kvs or [] if kv.get("serverId")}
+        semaphore = asyncio.Semaphore(int(os.getenv("GPORTAL_CONCURRENCY", "10")))
+
+        async def fetch(server_id: str):
+            async with semaphore:
+                try:
+                    result = await self.fetch(server_id)
+                except Exception as e:
+                    result = e
+
+            GPortal.results[server_id] = (time.time(), result)
+
+        await asyncio.gather(*[fetch(server_id) for server_id in server_ids])
+
+        # Drop the servers that are no longer queried
+        expired = time.time() - self.cache_ttl
+        GPortal.results = {k: v for k, v in GPortal.results.items() if v[0] >= expired}
+
+    async def fetch(self, server_id: str):
+        url = f"https://api.g-portal.com/gameserver/query/{server_id}"
+        start = time.time()
+
+        async with self.session.get(
+            url, timeout=aiohttp.ClientTimeout(total=self.timeout)
+        ) as response:
+            data = await response.json()
+            end = time.time()
+
+        return data, int((end - start) * 1000)
+
     async def query(self):
         host, port, server_id = (
             str(self.kv["host"]),
             int(str(self.kv["port"])),
             str(self.kv["serverId"]),
         )
-        url = f"https://api.g-portal.com/gameserver/query/{server_id}"
-        start = time.time()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                data = await response.json()
-                end = time.time()
+        # Use the result fetched by pre_query, fallback to fetch it one by one
+        fetched_at, result = GPortal.results.get(server_id, (0, None))
+
+        if result is None or time.time() - fetched_at > self.cache_ttl:
+            result = await self.fetch(server_id)
+
+        if isinstance(result, Exception):
+            raise result
+
+        data, ping = result
 
         if host != data["ipAddress"] or port != data["port"]:
             raise Exception("Invalid address or port")
@@ -42,8 +88,8 @@ class GPortal(Protocol):
             "players": None,
             "bots": None,
             "connect": f"{data['ipAddress']}:{data['port']}",
-            "ping": int((end - start) * 1000),
-            "raw": data,
+            "ping": ping,
+            "raw": dict(data),
         }
 
         return result
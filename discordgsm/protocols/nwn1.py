@@ -1,10 +1,8 @@
 from dataclasses import dataclass
-from typing import TYPE_CHECKING
-
-import aiohttp
-from opengsq.protocol_socket import Socket
+from typing import TYPE_CHECKING, Optional
 
 from discordgsm.protocols.protocol import Protocol
+from discordgsm.resolver import resolver
 
 if TYPE_CHECKING:
     from discordgsm.gamedig import GamedigResult
@@ -39,12 +37,11 @@ class NWN1(Protocol):
     name = "nwn1"
     master_servers = None
 
-    async def pre_query(self):
+    async def pre_query(self, kvs: Optional[list[dict]] = None):
         url = "https://nwnlist.herokuapp.com/servers/NWN1"
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                servers = await response.json(content_type=None)
+        async with self.session.get(url) as response:
+            servers = await response.json(content_type=None)
 
         NWN1.master_servers = {
             str(server["server_address"]): Response(**server) for server in servers
@@ -55,7 +52,7 @@ class NWN1(Protocol):
             await self.pre_query()
 
         host, port = str(self.kv["host"]), int(str(self.kv["port"]))
-        ip = await Socket.gethostbyname(host)
+        ip = await resolver.gethostbyname(host)
         key = f"{ip}:{port}"
 
         if key not in NWN1.master_servers:
@@ -1,5 +1,10 @@
 import os
 from abc import ABC, abstractmethod
+from typing import Optional
+
+import aiohttp
+
+from discordgsm.sessions import get_session
 
 
 class Protocol(ABC):
@@ -9,7 +14,13 @@ class Protocol(ABC):
         self.kv = kv
         self.timeout = float(os.getenv("TASK_QUERY_SERVER_TIMEOUT", "15"))
 
-    async def pre_query(self):
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Shared keep-alive session, use it instead of opening a new ClientSession per query"""
+        return get_session()
+
+    async def pre_query(self, kvs: Optional[list[dict]] = None):
+        """Prepare the queries of a cycle, kvs are the servers that will be queried"""
         pass
 
     @property
@@ -1,7 +1,5 @@
 from typing import TYPE_CHECKING
 
-import aiohttp
-
 from discordgsm.protocols.protocol import Protocol
 
 if TYPE_CHECKING:
@@ -15,9 +13,8 @@ class SCPSL(Protocol):
         api_key, account_id = str(self.kv["_api_key"]), str(self.kv["host"])
         url = f"https://api.scpslgame.com/serverinfo.php?id={account_id}&key={api_key}&lo=true&players=true&list=true&version=true&flags=true&nicknames=true&online=true"
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                data: dict = await response.json()
+        async with self.session.get(url) as response:
+            data: dict = await response.json()
 
         if not data["Success"]:
             raise Exception(data["Error"])
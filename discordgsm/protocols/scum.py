@@ -1,10 +1,7 @@
 from typing import TYPE_CHECKING
 
-import aiohttp
-
-from opengsq.protocol_socket import Socket
-
 from discordgsm.protocols.protocol import Protocol
+from discordgsm.resolver import resolver
 from discordgsm.version import __version__
 
 if TYPE_CHECKING:
@@ -16,18 +13,18 @@ class Scum(Protocol):
 
     async def query(self):
         host, port = str(self.kv["host"]), int(str(self.kv["port"]))
-        ip = await Socket.gethostbyname(host)
+        ip = await resolver.gethostbyname(host)
 
         url = f"https://api.hellbz.de/scum/api.php?address={ip}&port={port}"
 
-        async with aiohttp.ClientSession(
+        async with self.session.get(
+            url,
             headers={
                 "User-Agent": f"GameServerMonitor/{__version__} (DiscordGSM; https://discordgsm.com; https://github.com/DiscordGSM/GameServerMonitor; SCUM server status check)"
-            }
-        ) as session:
-            async with session.get(url) as response:
-                response.raise_for_status()
-                res: dict = await response.json()
+            },
+        ) as response:
+            response.raise_for_status()
+            res: dict = await response.json()
 
         if len(res.get("data", [])) <= 0:
             raise Exception("Server not found")
@@ -1,8 +1,6 @@
 import time
 from typing import TYPE_CHECKING
 
-import aiohttp
-
 from discordgsm.protocols.protocol import Protocol
 
 if TYPE_CHECKING:
@@ -21,10 +19,9 @@ class Terraria(Protocol):
         url = f"http://{host}:{port}/v2/server/status?players=true&rules=false&token={token}"
         start = time.time()
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                data = await response.json()
-                end = time.time()
+        async with self.session.get(url) as response:
+            data = await response.json()
+            end = time.time()
 
         result: GamedigResult = {
             "name": data["name"],
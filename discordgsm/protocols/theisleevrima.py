@@ -1,5 +1,5 @@
 import time
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
 import opengsq
 
@@ -21,7 +21,7 @@ class TheIsleEvrima(Protocol):
     _external_auth_token = ""
     _access_token = ""
 
-    async def pre_query(self):
+    async def pre_query(self, kvs: Optional[list[dict]] = None):
         TheIsleEvrima._access_token = await opengsq.EOS.get_access_token(
             client_id=self._client_id,
             client_secret=self._client_secret,
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+from typing import Hashable, Optional
+
+
+class TokenBucket:
+    """Token bucket refilled at `rate` tokens per second up to `capacity`.
+
+    The tokens go negative while requests are queued ahead, so a reservation
+    knows how long it has to wait without any lock on the event loop.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token, return the seconds to wait before it can be spent"""
+        self.refill(time.monotonic())
+        self.tokens -= 1
+
+        return max(0.0, -self.tokens / self.rate)
+
+
+class RateLimiter:
+    """Discord REST rate limiter with a global bucket and a bucket per route.
+
+    A route is usually a channel id, the message fetches, edits, sends and
+    purges of a channel share it. Requests wait for their route bucket first,
+    then for the global bucket.
+    """
+
+    def __init__(self, rate: float, route_rate: float, route_capacity: float):
+        self.bucket = TokenBucket(rate, rate)
+        self.route_rate = route_rate
+        self.route_capacity = route_capacity
+        self.routes: dict[Hashable, TokenBucket] = {}
+        self.queued = 0
+        self.peak_queued = 0
+        self.requests = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    async def wait(self, route: Optional[Hashable] = None):
+        """Wait until a request on the route is allowed"""
+        start = time.monotonic()
+        self.queued += 1
+        self.peak_queued = max(self.peak_queued, self.queued)
+
+        try:
+            if route is not None:
+                if (bucket := self.routes.get(route)) is None:
+                    bucket = self.routes[route] = TokenBucket(
+                        self.route_rate, self.route_capacity
+                    )
+
+                if delay := bucket.reserve():
+                    await asyncio.sleep(delay)
+
+            if delay := self.bucket.reserve():
+                await asyncio.sleep(delay)
+        finally:
+            self.queued -= 1
+
+        waited = time.monotonic() - start
+        self.requests += 1
+        self.wait_time += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def reset_stats(self):
+        """Return the stats since the last reset, then reset them and drop the idle routes"""
+        stats = {
+            "requests": self.requests,
+            "queued": self.queued,
+            "peak_queued": self.peak_queued,
+            "average_wait": self.requests and self.wait_time / self.requests or 0.0,
+            "max_wait": self.max_wait,
+        }
+        self.requests = 0
+        self.peak_queued = self.queued
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+        now = time.monotonic()
+
+        for route, bucket in list(self.routes.items()):
+            bucket.refill(now)
+
+            if bucket.tokens >= bucket.capacity:
+                del self.routes[route]
+
+        return stats
+
+
+rate_limiter = RateLimiter(
+    float(os.getenv("DISCORD_RATE_LIMIT", "45")),
+    float(os.getenv("DISCORD_ROUTE_RATE_LIMIT", "1")),
+    float(os.getenv("DISCORD_ROUTE_RATE_LIMIT_BURST", "5")),
+)
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import threading
+from typing import TYPE_CHECKING, Hashable, Optional
+
+if TYPE_CHECKING:
+    from discordgsm.server import Server
+
+
+class ServerRegistry:
+    """In-memory servers indexed by id, guild, channel, message and game.
+
+    The registry owns its Server objects and only hands out copies, it is
+    updated by the Database after each write so it always matches the rows.
+    """
+
+    indexed_fields = ("guild_id", "channel_id", "message_id", "game_id")
+
+    def __init__(self, servers: list[Server]):
+        self.lock = threading.Lock()
+        self.servers: dict[Hashable, Server] = {}
+        self.indexes: dict[str, dict[Hashable, set[Hashable]]] = {
+            field: {} for field in self.indexed_fields
+        }
+        self.put(servers)
+
+    def __len__(self):
+        return len(self.servers)
+
+    def __index(self, server: Server):
+        for field in self.indexed_fields:
+            self.indexes[field].setdefault(getattr(server, field), set()).add(server.id)
+
+    def __unindex(self, server: Server):
+        for field in self.indexed_fields:
+            index = self.indexes[field]
+            key = getattr(server, field)
+
+            if ids := index.get(key):
+                ids.discard(server.id)
+
+                if not ids:
+                    del index[key]
+
+    def put(self, servers: list[Server]):
+        """Add or replace the servers"""
+        with self.lock:
+            for server in servers:
+                if old := self.servers.get(server.id):
+                    self.__unindex(old)
+
+                self.servers[server.id] = server.copy()
+                self.__index(self.servers[server.id])
+
+    def update(self, servers: list[Server], *fields: str):
+        """Update the fields of the servers, the other fields keep their values"""
+        with self.lock:
+            for server in servers:
+                if (current := self.servers.get(server.id)) is None:
+                    continue
+
+                reindex = any(field in self.indexed_fields for field in fields)
+
+                if reindex:
+                    self.__unindex(current)
+
+                values = server.copy()
+
+                for field in fields:
+                    setattr(current, field, getattr(values, field))
+
+                if reindex:
+                    self.__index(current)
+
+    def remove(
+        self,
+        *,
+        guild_id: int = None,
+        channel_id: int = None,
+        servers: list[Server] = None,
+    ):
+        """Remove the servers of a guild, of a channel, or the given ones"""
+        with self.lock:
+            if guild_id is not None:
+                ids = self.indexes["guild_id"].get(guild_id, set())
+            elif channel_id is not None:
+                ids = self.indexes["channel_id"].get(channel_id, set())
+            else:
+                ids = {server.id for server in servers or []}
+
+            for id in list(ids):
+                if server := self.servers.pop(id, None):
+                    self.__unindex(server)
+
+    def find(
+        self,
+        *,
+        channel_id: int = None,
+        guild_id: int = None,
+        message_id: int = None,
+        game_id: str = None,
+        guild_ids: list[int] = None,
+        shard_ids: list[int] = None,
+        shard_count: int = 1,
+        filter_secret=False,
+    ) -> list[Server]:
+        """Copies of the servers matching all the filters, sorted like the database queries"""
+        filters = {
+            field: value
+            for field, value in zip(
+                self.indexed_fields, (guild_id, channel_id, message_id, game_id)
+            )
+            if value
+        }
+        guild_ids = None if guild_ids is None else set(guild_ids)
+        shard_ids = None if shard_ids is None else set(shard_ids)
+
+        with self.lock:
+            if filters:
+                # Start from the index of a filter, then check the others
+                field, value = next(iter(filters.items()))
+                ids = self.indexes[field].get(value, ())
+            else:
+                ids = self.servers.keys()
+
+            servers = [
+                server.copy(filter_secret)
+                for server in (self.servers[id] for id in ids)
+                if all(getattr(server, k) == v for k, v in filters.items())
+                and (guild_ids is None or server.guild_id in guild_ids)
+                and (shard_ids is None or server.shard_id(shard_count) in shard_ids)
+            ]
+
+        if game_id and not (channel_id or guild_id or message_id):
+            servers.sort(key=lambda server: server.id)
+        else:
+            servers.sort(key=lambda server: server.position)
+
+        return servers
+
+    def find_one(
+        self, channel_id: int, address: str = None, query_port: int = None
+    ) -> Optional[Server]:
+        with self.lock:
+            for id in self.indexes["channel_id"].get(channel_id, ()):
+                server = self.servers[id]
+
+                if server.address == address and server.query_port == query_port:
+                    return server.copy()
+
+        return None
+
+    def statistics(self):
+        with self.lock:
+            servers = list(self.servers.values())
+
+        return {
+            "messages": len(
+                {s.message_id for s in servers if s.message_id is not None}
+            ),
+            "channels": len({s.channel_id for s in servers}),
+            "guilds": len({s.guild_id for s in servers}),
+            "unique_servers": len(
+                {
+                    (
+                        s.game_id,
+                        s.address,
+                        s.query_port,
+                        str(sorted(s.query_extra.items())),
+                    )
+                    for s in servers
+                }
+            ),
+        }
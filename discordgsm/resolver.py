@@ -0,0 +1,101 @@
+import ipaddress
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Union
+
+from opengsq.protocol_socket import Socket
+
+from discordgsm.async_utils import SingleFlight
+
+
+class Resolver:
+    """Hostname resolver with a shared LRU cache.
+
+    Successful lookups are cached for `ttl` seconds and failed lookups for
+    `negative_ttl` seconds. Concurrent lookups of the same hostname on an event
+    loop share one request to the system resolver.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.maxsize = max(1, maxsize)
+        self.lock = threading.Lock()
+        self.cache: OrderedDict[
+            str, tuple[float, Union[str, tuple[type[Exception], tuple]]]
+        ] = OrderedDict()
+        """hostname -> (expiry, ip address or the type and args of the error)"""
+        self.single_flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+
+    async def gethostbyname(self, hostname: str) -> str:
+        try:
+            # IP addresses need no lookup
+            return str(ipaddress.ip_address(hostname))
+        except ValueError:
+            pass
+
+        with self.lock:
+            expiry, value = self.cache.get(hostname, (0.0, None))
+
+            if time.time() < expiry:
+                self.cache.move_to_end(hostname)
+                self.hits += 1
+            else:
+                self.misses += 1
+                value = None
+
+        if value is None:
+            try:
+                value = await self.single_flight.run(
+                    hostname, lambda: Socket.gethostbyname(hostname)
+                )
+                self.__store(hostname, value, self.ttl)
+            except Exception as e:
+                self.__store(hostname, (type(e), e.args), self.negative_ttl)
+                raise
+
+        if isinstance(value, tuple):
+            # A new exception per hit, a shared one would grow its traceback on every raise
+            error_type, args = value
+
+            try:
+                error = error_type(*args)
+            except Exception:
+                error = OSError(*args)
+
+            raise error
+
+        return value
+
+    def __store(
+        self,
+        hostname: str,
+        value: Union[str, tuple[type[Exception], tuple]],
+        ttl: float,
+    ):
+        with self.lock:
+            self.cache[hostname] = (time.time() + ttl, value)
+            self.cache.move_to_end(hostname)
+
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+    def reset_stats(self):
+        """Return the hit rate since the last reset, then reset the counters"""
+        with self.lock:
+            total = self.hits + self.misses
+            hit_rate = total > 0 and self.hits / total or 0.0
+            self.hits = self.misses = 0
+
+        return hit_rate
+
+
+resolver = Resolver(
+    float(os.getenv("DNS_CACHE_TTL", "300")),
+    float(os.getenv("DNS_CACHE_NEGATIVE_TTL", "30")),
+    int(os.getenv("DNS_CACHE_SIZE", "10000")),
+)
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Awaitable,
+    Callable,
+    Hashable,
+    Iterable,
+    Optional,
+    TypeVar,
+)
+
+if TYPE_CHECKING:
+    from discordgsm.server import Server
+
+T = TypeVar("T")
+
+
+def parse_limits(value: str) -> dict[str, int]:
+    """Parse "asa=10;gportal=5" into {"asa": 10, "gportal": 5}"""
+    limits: dict[str, int] = {}
+
+    for item in value.replace(",", ";").split(";"):
+        if "=" in item:
+            name, limit = item.split("=", 1)
+
+            if limit.strip().isdigit():
+                limits[name.strip()] = max(1, int(limit))
+
+    return limits
+
+
+class QueryPool:
+    """Keep a bounded number of queries in flight, with optional per-protocol caps.
+
+    Unlike awaiting fixed-size chunks, a slot is handed to the next query as soon as
+    any query finishes, so one slow timeout only occupies its own slot.
+    """
+
+    def __init__(self, concurrency: int, protocol_limits: dict[str, int] = None):
+        self.concurrency = max(1, concurrency)
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.protocol_semaphores = {
+            name: asyncio.Semaphore(limit)
+            for name, limit in (protocol_limits or {}).items()
+        }
+        self.start_time = time.time()
+        self.busy_time = 0.0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    @staticmethod
+    def from_env(processes=1) -> QueryPool:
+        """QueryPool configured by the environment, the limits are split between the processes"""
+        concurrency = int(os.getenv("TASK_QUERY_CHUNK_SIZE", "50"))
+        protocol_limits = parse_limits(
+            os.getenv(
+                "TASK_QUERY_PROTOCOL_CHUNK_SIZE", "asa=10;discord=10;gportal=10;scpsl=5"
+            )
+        )
+
+        return QueryPool(
+            math.ceil(concurrency / processes),
+            {k: math.ceil(v / processes) for k, v in protocol_limits.items()},
+        )
+
+    async def run(self, protocol: Optional[str], func: Callable[[], Awaitable[T]]) -> T:
+        async with AsyncExitStack() as stack:
+            # Wait for the protocol cap first, so a capped protocol never holds a global slot idle
+            if semaphore := self.protocol_semaphores.get(protocol):
+                await stack.enter_async_context(semaphore)
+
+            await stack.enter_async_context(self.semaphore)
+
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            start = time.time()
+
+            try:
+                return await func()
+            finally:
+                self.busy_time += time.time() - start
+                self.in_flight -= 1
+
+    @property
+    def wall_time(self):
+        return time.time() - self.start_time
+
+    @property
+    def utilisation(self):
+        """Fraction of the available slot time spent on queries"""
+        capacity = self.wall_time * self.concurrency
+        return capacity > 0 and min(1.0, self.busy_time / capacity) or 0.0
+
+
+@dataclass
+class ScheduleState:
+    due: float = 0.0
+    """Timestamp of the next query"""
+    failures: int = 0
+    """Consecutive failed queries"""
+    idle: int = 0
+    """Consecutive queries without any change while empty"""
+    signature: Optional[Hashable] = None
+    """Signature of the last result, used to detect changes"""
+
+
+class QueryScheduler:
+    """Priority queue of distinct servers keyed on their next due time.
+
+    Busy or recently changed servers are due every `base` seconds, empty and stable
+    servers are stretched up to `base * idle_max`, and after `threshold` consecutive
+    failures offline servers back off to every 2nd, 4th, 8th... interval, up to
+    `base * backoff_max`. The state is shared between the query thread and the bot.
+    """
+
+    def __init__(self, threshold: int, backoff_max: int, idle_max: int):
+        self.threshold = max(1, threshold)
+        self.backoff_max = max(1, backoff_max)
+        self.idle_max = max(1, idle_max)
+        self.lock = threading.Lock()
+        self.heap: list[tuple[float, int, Hashable]] = []
+        self.counter = itertools.count()
+        self.states: dict[Hashable, ScheduleState] = {}
+        self.reset_ids: set[int] = set()
+
+    def multiplier(self, state: ScheduleState):
+        """Number of base intervals until the next query"""
+        if state.failures >= self.threshold:
+            return min(2 ** (state.failures - self.threshold + 1), self.backoff_max)
+
+        return min(2**state.idle, self.idle_max)
+
+    def due(
+        self, distinct_servers: dict[Hashable, list[Server]], now: float, slack: float
+    ) -> set[Hashable]:
+        """Pop the servers due before `now + slack`"""
+        due: set[Hashable] = set()
+
+        with self.lock:
+            for key, servers in distinct_servers.items():
+                if ids := self.reset_ids.intersection(server.id for server in servers):
+                    self.reset_ids.difference_update(ids)
+                    self.states[key] = ScheduleState()
+                    due.add(key)
+                elif key not in self.states:
+                    # Continue from the persisted failure count, e.g. after a restart
+                    raw = servers[0].result.get("raw", {})
+                    failures = int(raw.get("__fail_query_count", "0"))
+                    self.states[key] = ScheduleState(failures=failures)
+                    due.add(key)
+
+            while self.heap and self.heap[0][0] <= now + slack:
+                timestamp, _, key = heapq.heappop(self.heap)
+
+                if key not in distinct_servers:
+                    # The server has been deleted or its address changed
+                    self.states.pop(key, None)
+                elif (state := self.states.get(key)) and state.due == timestamp:
+                    due.add(key)
+
+        return due
+
+    def record(
+        self,
+        key: Hashable,
+        *,
+        status: bool,
+        base: float,
+        now: float,
+        busy: bool = False,
+        signature: Optional[Hashable] = None,
+    ):
+        """Schedule the next query from the query result"""
+        with self.lock:
+            state = self.states.setdefault(key, ScheduleState())
+
+            if status:
+                state.idle = (
+                    0 if busy or signature != state.signature else state.idle + 1
+                )
+                state.failures = 0
+                state.signature = signature
+            else:
+                state.idle = 0
+                state.failures += 1
+
+            state.due = now + base * self.multiplier(state)
+            heapq.heappush(self.heap, (state.due, next(self.counter), key))
+
+    def reset(self, servers: list[Server]):
+        """Query the servers on the next cycle again"""
+        with self.lock:
+            self.reset_ids.update(server.id for server in servers)
+
+    def release(self, keys: Iterable[Hashable], now: float):
+        """Query the popped servers that got no result on the next cycle again"""
+        with self.lock:
+            for key in keys:
+                if state := self.states.get(key):
+                    state.due = now
+                    heapq.heappush(self.heap, (state.due, next(self.counter), key))
@@ -1,13 +1,18 @@
 from __future__ import annotations
 
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from typing import TYPE_CHECKING, Optional
 
 if TYPE_CHECKING:
     from discordgsm.gamedig import GamedigResult
 
 
+def loads(data) -> dict:
+    """JSON column to dictionary, JSONB columns are decoded by the driver already"""
+    return json.loads(data) if isinstance(data, (str, bytes)) else data
+
+
 @dataclass
 class Server:
     id: int
@@ -50,10 +55,92 @@ class Server:
             style_data={},
         )
 
+    def shard_id(self, shard_count: int) -> int:
+        """Discord shard of the server's guild"""
+        return (int(self.guild_id) >> 22) % max(1, shard_count)
+
+    def copy(self, filter_secret=False) -> Server:
+        """Copy of the server, its dictionaries can be updated without touching the original"""
+        result = dict(self.result)
+
+        if "raw" in result:
+            result["raw"] = dict(result["raw"])
+
+        server = replace(
+            self,
+            query_extra=dict(self.query_extra),
+            result=result,
+            style_data=dict(self.style_data),
+        )
+
+        if filter_secret:
+            # Filter key started with _ and filter the description since it may contain secrets
+            server.query_extra = {
+                k: v
+                for k, v in server.query_extra.items()
+                if not str(k).startswith("_")
+            }
+            server.style_data = {
+                k: v
+                for k, v in server.style_data.items()
+                if not str(k).startswith("_") and k != "description"
+            }
+
+        return server
+
+    def fingerprint(self) -> int:
+        """Hash of the status and result, ignoring the fields that change on every query"""
+        raw = {
+            k: v for k, v in self.result.get("raw", {}).items() if k != "__ping_samples"
+        }
+        result = {**self.result, "ping": None, "raw": raw}
+
+        return hash((self.status, json.dumps(result, sort_keys=True, default=str)))
+
+    def player_data(self) -> tuple[int, int, int]:
+        """Players, bots and max players of the result"""
+        if "numplayers" in self.result:
+            players = int(self.result.get("numplayers", 0))
+        else:
+            players = int(
+                self.result.get("raw", {}).get(
+                    "numplayers", len(self.result["players"])
+                )
+            )
+
+        if "numbots" in self.result:
+            bots = int(self.result.get("numbots", 0))
+        else:
+            bots = int(
+                self.result.get("raw", {}).get("numbots", len(self.result["bots"]))
+            )
+
+        maxplayers = int(self.result.get("maxplayers", 0))
+
+        return players, bots, maxplayers
+
+    def summary(self) -> dict:
+        """Fields of the result read without the player lists, stored in their own columns"""
+        try:
+            players, bots, maxplayers = self.player_data()
+        except (KeyError, TypeError, ValueError):
+            players, bots, maxplayers = None, None, None
+
+        ping = self.result.get("ping")
+
+        return {
+            "numplayers": players,
+            "numbots": bots,
+            "maxplayers": maxplayers,
+            "name": self.result.get("name"),
+            "map": self.result.get("map"),
+            "ping": None if ping is None else int(ping),
+        }
+
     @staticmethod
     def from_list(row: tuple, filter_secret=False) -> Server:
-        query_extra: dict = json.loads(row[8])
-        style_data: dict = json.loads(row[12])
+        query_extra: dict = loads(row[8])
+        style_data: dict = loads(row[12])
 
         if filter_secret:
             # Filter key started with _ and filter the description since it may contain secrets
@@ -77,7 +164,7 @@ class Server:
             query_port=row[7],
             query_extra=query_extra,
             status=row[9] == 1,
-            result=json.loads(row[10]),
+            result=loads(row[10]),
             style_id=row[11],
             style_data=style_data,
         )
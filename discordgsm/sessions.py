@@ -0,0 +1,33 @@
+import asyncio
+import os
+import weakref
+
+import aiohttp
+
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = weakref.WeakKeyDictionary()
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Shared aiohttp ClientSession of the running event loop.
+
+    The bot and the query thread run on different event loops, a ClientSession
+    cannot be shared across loops, so each loop gets its own pooled session.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=int(os.getenv("HTTP_CONNECTION_LIMIT", "100")),
+            limit_per_host=int(os.getenv("HTTP_CONNECTION_LIMIT_PER_HOST", "20")),
+            keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30")),
+        )
+        session = _sessions[loop] = aiohttp.ClientSession(connector=connector)
+
+    return session
+
+
+async def close_session():
+    """Close the shared aiohttp ClientSession of the running event loop"""
+    if session := _sessions.pop(asyncio.get_running_loop(), None):
+        await session.close()
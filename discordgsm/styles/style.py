@@ -1,14 +1,14 @@
-import socket
 from abc import ABC, abstractmethod
 from datetime import date, datetime
 from typing import Dict, Optional, Union
 
-import aiohttp
 from discord import Color, Embed, Emoji, Locale, PartialEmoji, TextStyle
 from discord.ui import TextInput
 
+from discordgsm.resolver import resolver
 from discordgsm.server import Server
 from discordgsm.service import gamedig, tz
+from discordgsm.sessions import get_session
 from discordgsm.translator import t
 from discordgsm.version import __version__
 
@@ -105,11 +105,10 @@ class Style(ABC):
             )
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(
-                    f"https://ipinfo.io/{socket.gethostbyname(self.server.address)}/country"
-                ) as response:
-                    data = await response.text()
+            ip = await resolver.gethostbyname(self.server.address)
+
+            async with get_session().get(f"https://ipinfo.io/{ip}/country") as response:
+                data = await response.text()
 
             if "{" not in data:
                 style_data["country"] = data.replace("\n", "").strip()
@@ -230,25 +229,7 @@ class Style(ABC):
 
     @staticmethod
     def get_player_data(server: Server):
-        if "numplayers" in server.result:
-            players = int(server.result.get("numplayers", 0))
-        else:
-            players = int(
-                server.result.get("raw", {}).get(
-                    "numplayers", len(server.result["players"])
-                )
-            )
-
-        if "numbots" in server.result:
-            bots = int(server.result.get("numbots", 0))
-        else:
-            bots = int(
-                server.result.get("raw", {}).get("numbots", len(server.result["bots"]))
-            )
-
-        maxplayers = int(server.result.get("maxplayers", 0))
-
-        return players, bots, maxplayers
+        return server.player_data()
 
     @staticmethod
     def to_players_string(players: int, bots: int, maxplayers: int):
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import queue
+import time
+import zlib
+from dataclasses import replace
+from typing import TYPE_CHECKING, Callable, Hashable, Optional
+
+from discordgsm.async_utils import cancel_pending_tasks
+from discordgsm.logger import Logger
+from discordgsm.protocols import Protocol, protocols
+from discordgsm.scheduler import QueryPool
+from discordgsm.server import Server
+from discordgsm.sessions import close_session
+
+if TYPE_CHECKING:
+    from discordgsm.gamedig import Gamedig, GamedigResult
+
+
+async def query_server(gamedig: Gamedig, server: Server):
+    """Query server, return the status and the result"""
+    try:
+        result: GamedigResult = await gamedig.query(server)
+        Logger.debug(
+            f"Query servers: ({server.game_id})[{server.address}:{server.query_port}] Success. Ping: {result.get('ping', -1)}ms"
+        )
+        return True, result
+    except Exception as e:
+        Logger.debug(
+            f"Query servers: ({server.game_id})[{server.address}:{server.query_port}] {type(e).__name__}: {e}"
+        )
+        return False, None
+
+
+async def pre_query(protocol: Protocol, kvs: list[dict]):
+    """Pre query"""
+    try:
+        if await asyncio.shield(protocol.pre_query(kvs)):
+            Logger.debug(f"Pre query servers: [{protocol.name}] Success.")
+            return True
+    except Exception as e:
+        Logger.debug(
+            f"Pre query servers: [{protocol.name}] Fail to query. {type(e).__name__}: {e}"
+        )
+        return False
+
+    return None
+
+
+async def pre_query_servers(gamedig: Gamedig, servers: list[Server]):
+    """Pre query servers, some servers cannot be queried one by one"""
+    protocols_kvs: dict[str, list[dict]] = {}
+
+    for server in servers:
+        if game := gamedig.games.get(server.game_id):
+            protocols_kvs.setdefault(game["protocol"], []).append(gamedig.kv(server))
+
+    pre_query_tasks = [
+        pre_query(protocol({}), protocols_kvs[name])
+        for name, protocol in protocols.items()
+        if protocol.pre_query_required and name in protocols_kvs
+    ]
+    Logger.debug(f"Pre query servers: Tasks = {len(pre_query_tasks)}.")
+    start_time = time.time()
+    results = await asyncio.gather(*pre_query_tasks)
+    failed = sum(result is False for result in results)
+    success = len(results) - failed
+    percent = len(results) > 0 and int(failed / len(results) * 100) or 0
+    execution_time = time.time() - start_time
+    Logger.debug(
+        f"Pre query servers: Total = {len(results)}, Success = {success}, Failed = {failed} ({percent}% fail), Time used = {execution_time:.2f} seconds"
+    )
+
+
+def worker_main(tasks: multiprocessing.Queue, results: multiprocessing.Queue):
+    """Entry point of a query worker process, query the batches sent by QueryWorkers"""
+    from discordgsm.gamedig import Gamedig
+
+    gamedig = Gamedig()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def run(
+        cycle: int, index: int, processes: int, batch: list[tuple[Hashable, Server]]
+    ):
+        await pre_query_servers(gamedig, [server for _, server in batch])
+        pool = QueryPool.from_env(processes)
+
+        async def query(key: Hashable, server: Server):
+            game = gamedig.games.get(server.game_id)
+            protocol = game["protocol"] if game else None
+            status, result = await pool.run(
+                protocol, lambda: query_server(gamedig, server)
+            )
+            results.put((cycle, index, key, status, result))
+
+        await asyncio.gather(*[query(key, server) for key, server in batch])
+        results.put((cycle, index, None, None, None))
+
+    while (task := tasks.get()) is not None:
+        loop.run_until_complete(run(*task))
+
+    # The background tasks of the protocols may still be pending
+    loop.run_until_complete(cancel_pending_tasks())
+    loop.run_until_complete(close_session())
+    loop.close()
+
+
+class QueryWorkers:
+    """Query the distinct servers in worker processes.
+
+    The servers are partitioned by a stable hash of their key, so a server is
+    usually queried by the same process and hits its caches. Each process runs
+    its own event loop with the protocols, the results are streamed back.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = max(0, processes)
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: list[Optional[multiprocessing.Process]] = [None] * self.processes
+        self.tasks: list[multiprocessing.Queue] = []
+        self.results: Optional[multiprocessing.Queue] = None
+        self.cycle = 0
+
+    @property
+    def enabled(self):
+        return self.processes > 0
+
+    def start(self):
+        """Start the worker processes not running"""
+        if self.results is None:
+            self.tasks = [self.context.Queue() for _ in range(self.processes)]
+            self.results = self.context.Queue()
+
+        for index, worker in enumerate(self.workers):
+            if worker is None or not worker.is_alive():
+                if worker is not None:
+                    Logger.error(f"Query workers: worker {index} stopped, restarting")
+                    # Drop the batch left behind by the stopped worker
+                    self.tasks[index] = self.context.Queue()
+
+                worker = self.context.Process(
+                    target=worker_main,
+                    args=(self.tasks[index], self.results),
+                    daemon=True,
+                )
+                worker.start()
+                self.workers[index] = worker
+
+    async def run(
+        self,
+        servers: dict[Hashable, Server],
+        on_result: Callable[[Hashable, bool, Optional[GamedigResult]], None],
+        stop: Callable[[], bool] = lambda: False,
+    ):
+        """Query a server of each key, call on_result as the results arrive"""
+        self.start()
+        self.cycle += 1
+        batches: list[list[tuple[Hashable, Server]]] = [[] for _ in self.workers]
+
+        for key, server in servers.items():
+            # Only send what the query needs
+            raw = server.result.get("raw", {})
+            server = replace(
+                server,
+                result={
+                    "raw": {
+                        k: raw[k]
+                        for k in ("__fail_query_count", "__ping_samples")
+                        if k in raw
+                    }
+                },
+                style_data={},
+            )
+            index = zlib.crc32(repr(key).encode()) % self.processes
+            batches[index].append((key, server))
+
+        pending: set[int] = set()
+
+        for index, batch in enumerate(batches):
+            if batch:
+                self.tasks[index].put((self.cycle, index, self.processes, batch))
+                pending.add(index)
+
+        loop = asyncio.get_running_loop()
+
+        while pending and not stop():
+            messages = await loop.run_in_executor(None, self.receive)
+
+            if not messages:
+                # Give up the batches of the stopped workers
+                pending = {i for i in pending if self.workers[i].is_alive()}
+
+            for cycle, index, key, status, result in messages:
+                if cycle != self.cycle:
+                    continue
+
+                if key is None:
+                    pending.discard(index)
+                else:
+                    on_result(key, status, result)
+
+    def receive(self, timeout=1.0, limit=1000):
+        """Wait for the results, then take the ones already received"""
+        messages = []
+
+        try:
+            messages.append(self.results.get(timeout=timeout))
+
+            while len(messages) < limit:
+                messages.append(self.results.get_nowait())
+        except queue.Empty:
+            pass
+
+        return messages
+
+    def close(self, timeout=3.0):
+        """Stop the worker processes, blocking, run it in an executor on an event loop"""
+        workers = [worker for worker in self.workers if worker and worker.is_alive()]
+
+        for index, worker in enumerate(self.workers):
+            if worker in workers:
+                self.tasks[index].put(None)
+
+        # The workers stop together, wait for them within one timeout
+        deadline = time.monotonic() + timeout
+
+        for worker in workers:
+            worker.join(timeout=max(0.0, deadline - time.monotonic()))
+
+            if worker.is_alive():
+                worker.terminate()
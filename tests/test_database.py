@@ -0,0 +1,261 @@
+import asyncio
+import threading
+
+import pytest
+
+from discordgsm.database import Database, stringify
+from discordgsm.server import Server
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.setenv("DB_CONNECTION", "sqlite")
+    monkeypatch.setenv("DATABASE_URL", "")
+    database = Database()
+    database.database = str(tmp_path / "servers.db")
+    database.create_table_if_not_exists()
+
+    # 10 guilds with 100 servers each, the guild ids spread over 4 shards
+    guild_ids = [(i << 22) + i for i in range(10)]
+    conn, cursor = database.cursor()
+    cursor.executemany(
+        "INSERT INTO servers (position, guild_id, channel_id, game_id, address, query_port, query_extra, status, result, style_id, style_data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [
+            (
+                i,
+                guild_id,
+                guild_id + 1,
+                "minecraft",
+                f"127.0.0.{i}",
+                25565,
+                "{}",
+                1,
+                '{"raw":{}}',
+                "Medium",
+                "{}",
+            )
+            for guild_id in guild_ids
+            for i in range(100)
+        ],
+    )
+    database.close(conn, cursor, commit=True)
+
+    yield database
+
+    database.dispose()
+
+
+def all_servers(database: Database, **filters) -> list[Server]:
+    return asyncio.run(database.all_servers(**filters))
+
+
+def test_all_servers_filters(database: Database):
+    assert len(all_servers(database)) == 1000
+    assert len(all_servers(database, guild_id=3 << 22 | 3)) == 100
+    assert len(all_servers(database, guild_ids=[0, 1 << 22 | 1])) == 200
+    assert len(all_servers(database, guild_ids=[])) == 0
+
+    # Guilds 0, 4 and 8 are on shard 0 of 4
+    servers = all_servers(database, shard_ids=[0], shard_count=4)
+    assert len(servers) == 300
+    assert {server.shard_id(4) for server in servers} == {0}
+
+    # The filters are combined
+    servers = all_servers(
+        database, shard_ids=[0], shard_count=4, guild_ids=[0, 1 << 22 | 1]
+    )
+    assert len(servers) == 100
+
+
+def test_all_servers_filters_use_index(database: Database):
+    conn, cursor = database.cursor()
+    cursor.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM servers WHERE guild_id IN (?, ?)", (0, 1)
+    )
+    plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+    database.close(conn, cursor)
+
+    assert "servers_guild_id" in plan
+
+
+def test_registry_matches_database(database: Database):
+    expected = all_servers(database, shard_ids=[1, 2], shard_count=4)
+    assert asyncio.run(database.load_registry(shard_ids=[1, 2], shard_count=4)) == len(
+        expected
+    )
+    assert sorted(s.id for s in all_servers(database)) == sorted(s.id for s in expected)
+    assert len(all_servers(database, guild_ids=[1 << 22 | 1, 3 << 22 | 3])) == 100
+
+
+def test_migrations_applied_once(database: Database):
+    version = database.schema_version()
+    assert version == max(v for v, _, _ in database.migrations())
+
+    # Applying them again is a no-op
+    database.migrate()
+    assert database.schema_version() == version
+
+    # The migrations can be applied again, e.g. after failing before saving the version
+    conn, cursor = database.cursor(write=True)
+    cursor.execute("PRAGMA user_version = 0")
+    database.close(conn, cursor, commit=True)
+    database.migrate()
+    assert database.schema_version() == version
+
+    conn, cursor = database.cursor()
+    cursor.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM servers WHERE channel_id = ? ORDER BY position",
+        (1,),
+    )
+    plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+    database.close(conn, cursor)
+
+    assert "servers_channel_id_position" in plan
+
+
+def test_reads_are_not_blocked_by_the_writer(database: Database):
+    conn, cursor = database.cursor(write=True)
+    cursor.execute("UPDATE servers SET status = 0")
+
+    # The uncommitted write is not visible to the readers of the other threads
+    servers = all_servers(database, guild_id=0)
+    assert {server.status for server in servers} == {True}
+
+    database.close(conn, cursor, commit=True)
+    servers = all_servers(database, guild_id=0)
+    assert {server.status for server in servers} == {False}
+
+
+def test_failed_write_releases_the_writer(database: Database):
+    conn, cursor = database.cursor(write=True)
+
+    with pytest.raises(Exception):
+        cursor.execute("UPDATE servers SET unknown = 0")
+
+    conn, cursor = database.cursor(write=True)
+    cursor.execute("UPDATE servers SET status = 0 WHERE guild_id = 0")
+    database.close(conn, cursor, commit=True)
+
+
+def test_offline_servers_are_updated_in_place(database: Database):
+    servers = all_servers(database, guild_id=1 << 22 | 1)[:2]
+
+    for fail_query_count, name in ((1, "Server"), (2, "Other")):
+        for server in servers:
+            server.status = False
+            server.result["name"] = name
+            server.result["raw"]["__fail_query_count"] = fail_query_count
+
+        assert asyncio.run(database.update_servers(servers)) == 2
+
+    # The second update only patched the bookkeeping fields, the name was not rewritten
+    server = all_servers(database, guild_id=1 << 22 | 1)[0]
+    assert server.status is False
+    assert server.result["name"] == "Server"
+    assert server.result["raw"]["__fail_query_count"] == 2
+
+
+def test_player_stats_from_summary_columns(database: Database):
+    guild_id = 1 << 22 | 1
+    servers = all_servers(database, guild_id=guild_id)
+
+    for i, server in enumerate(servers):
+        server.status = i % 2 == 0
+        server.result = {"numplayers": i, "numbots": 1, "maxplayers": 100, "raw": {}}
+
+    asyncio.run(database.update_servers(servers))
+
+    stats = asyncio.run(database.player_stats(guild_id=guild_id))
+    assert stats == {
+        "servers": 100,
+        "online": 50,
+        "players": sum(range(100)),
+        "bots": 100,
+        "maxplayers": 10000,
+    }
+
+    asyncio.run(database.load_registry())
+    assert asyncio.run(database.player_stats(guild_id=guild_id)) == stats
+
+
+def metrics_count(database: Database) -> int:
+    conn, cursor = database.cursor()
+    cursor.execute("SELECT COUNT(*) FROM metrics")
+    count = cursor.fetchone()[0]
+    database.close(conn, cursor)
+
+    return count
+
+
+def test_metrics_are_appended_and_pruned(database: Database, monkeypatch):
+    monkeypatch.setenv("METRICS_ENABLE", "true")
+    servers = all_servers(database, guild_id=1 << 22 | 1)
+
+    asyncio.run(database.update_metrics(servers))
+    assert metrics_count(database) == 100
+
+    # Every record is older than a negative retention
+    monkeypatch.setenv("METRICS_RETENTION", "-1")
+    database.metrics_pruned_at = 0
+    asyncio.run(database.update_metrics(servers[:10]))
+    assert metrics_count(database) == 0
+
+
+def test_deleted_servers_drop_their_fingerprints(database: Database):
+    guild_id, channel_id = 1 << 22 | 1, (2 << 22 | 2) + 1
+    servers = all_servers(database, guild_id=guild_id)
+    servers += all_servers(database, channel_id=channel_id)
+    asyncio.run(database.update_servers(servers))
+    assert len(database.fingerprints) == 200
+
+    asyncio.run(database.delete_servers(guild_id=guild_id))
+    assert len(database.fingerprints) == 100
+
+    asyncio.run(database.delete_servers(channel_id=channel_id))
+    assert len(database.fingerprints) == 0
+
+
+def test_switch_into_a_channel_with_the_same_address(database: Database):
+    # Both channels monitor 127.0.0.0:25565
+    server = all_servers(database, channel_id=(1 << 22 | 1) + 1)[0]
+    channel_id = (2 << 22 | 2) + 1
+    asyncio.run(database.update_servers([server], channel_id=channel_id))
+
+    servers = all_servers(database, channel_id=channel_id)
+    assert len(servers) == 101
+    assert [s.address for s in servers].count(server.address) == 2
+
+
+def test_transaction_releases_the_writer_on_errors(database: Database):
+    with pytest.raises(ValueError):
+        with database.transaction() as cursor:
+            cursor.execute("UPDATE servers SET status = 0")
+            raise ValueError()
+
+    # Rolled back, and the writer can be taken from another thread
+    def write():
+        with database.transaction() as cursor:
+            cursor.execute("UPDATE servers SET status = 1 WHERE position = 0")
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert all(server.status for server in all_servers(database))
+
+
+def test_nul_characters_are_stripped_from_json(database: Database):
+    # PostgreSQL JSONB rejects \u0000, a backslash followed by u0000 is kept
+    assert (
+        stringify({"name\x00": ["A\x00B", "\\u0000"]}) == '{"name":["AB","\\\\u0000"]}'
+    )
+
+    servers = all_servers(database, guild_id=1 << 22 | 1)[:1]
+    servers[0].result["name"] = "Server\x00"
+    servers[0].result["raw"]["motd"] = {"text": "\x00Hello"}
+    asyncio.run(database.update_servers(servers))
+
+    server = all_servers(database, guild_id=1 << 22 | 1)[0]
+    assert server.result["name"] == "Server"
+    assert server.result["raw"]["motd"] == {"text": "Hello"}
@@ -0,0 +1,38 @@
+from discordgsm.scheduler import QueryScheduler
+from discordgsm.server import Server
+
+
+def queried_cycles(scheduler: QueryScheduler, cycles: int, status: bool, busy=False):
+    """Cycles of a server querying every due cycle, the cycle length is the base interval"""
+    cycle = 120.0
+    key = ("minecraft", "127.0.0.1", 25565, "{}")
+    distinct_servers = {
+        key: [Server.new(0, 0, "minecraft", "127.0.0.1", 25565, {}, {"raw": {}})]
+    }
+    queried = []
+
+    for i in range(cycles):
+        now = i * cycle
+
+        if key in scheduler.due(distinct_servers, now, cycle / 2):
+            queried.append(i)
+            scheduler.record(
+                key, status=status, base=cycle, now=now, busy=busy, signature=1
+            )
+
+    return queried
+
+
+def test_offline_servers_back_off_in_cycles():
+    scheduler = QueryScheduler(threshold=2, backoff_max=8, idle_max=1)
+
+    # Every cycle until the threshold, then every 2nd, 4th and 8th cycle
+    assert queried_cycles(scheduler, 40, status=False) == [0, 1, 3, 7, 15, 23, 31, 39]
+
+
+def test_idle_servers_are_stretched_in_cycles():
+    scheduler = QueryScheduler(threshold=2, backoff_max=8, idle_max=4)
+    assert queried_cycles(scheduler, 16, status=True) == [0, 1, 3, 7, 11, 15]
+
+    scheduler = QueryScheduler(threshold=2, backoff_max=8, idle_max=4)
+    assert queried_cycles(scheduler, 4, status=True, busy=True) == [0, 1, 2, 3]
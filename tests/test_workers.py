@@ -0,0 +1,101 @@
+import asyncio
+
+import aiohttp
+
+from discordgsm import workers
+from discordgsm.async_utils import LoopThread
+from discordgsm.gamedig import Gamedig
+from discordgsm.protocols import protocols
+from discordgsm.server import Server
+from discordgsm.sessions import close_session, get_session
+
+
+def test_pre_query_servers_calls_every_protocol(monkeypatch):
+    async def request(*args, **kwargs):
+        raise aiohttp.ClientConnectionError("offline")
+
+    # No network, every pre query fails with a connection error
+    monkeypatch.setattr(aiohttp.ClientSession, "_request", request)
+
+    called: list[str] = []
+    errors: list[str] = []
+
+    async def pre_query(protocol, kvs):
+        called.append(protocol.name)
+
+        try:
+            await protocol.pre_query(kvs)
+        except Exception as e:
+            errors.append(f"{protocol.name}: {type(e).__name__}: {e}")
+
+    monkeypatch.setattr(workers, "pre_query", pre_query)
+
+    gamedig = Gamedig()
+    required = {
+        name for name, protocol in protocols.items() if protocol.pre_query_required
+    }
+    game_ids = {}
+
+    for game_id, game in gamedig.games.items():
+        if game["protocol"] in required:
+            game_ids.setdefault(game["protocol"], game_id)
+
+    assert set(game_ids) == required
+
+    servers = [
+        Server.new(0, 0, game_id, "127.0.0.1", 27015, {}, {"raw": {}})
+        for game_id in game_ids.values()
+    ]
+
+    async def run():
+        try:
+            await workers.pre_query_servers(gamedig, servers)
+        finally:
+            await close_session()
+
+    asyncio.run(run())
+
+    assert sorted(called) == sorted(required)
+    assert not [error for error in errors if "TypeError" in error], errors
+
+
+def test_query_workers_round_trip():
+    query_workers = workers.QueryWorkers(1)
+    server = Server.new(0, 0, "unknown", "127.0.0.1", 27015, {}, {"raw": {}})
+    results = []
+
+    async def run():
+        await query_workers.run(
+            {("unknown", "127.0.0.1", 27015): server},
+            lambda key, status, result: results.append((key, status, result)),
+        )
+
+    try:
+        asyncio.run(run())
+    finally:
+        query_workers.close()
+
+    # The unknown game fails in the worker process, the failure is sent back
+    assert results == [(("unknown", "127.0.0.1", 27015), False, None)]
+    assert not query_workers.workers[0].is_alive()
+
+
+def test_query_loop_keeps_the_session_across_cycles():
+    query_loop = LoopThread("query")
+    background: list[asyncio.Task] = []
+
+    async def cycle():
+        # A background task like the EOS token refresh, it outlives the cycle
+        background.append(asyncio.create_task(asyncio.sleep(3600)))
+        return get_session()
+
+    try:
+        session = query_loop.submit(cycle()).result(5)
+        assert query_loop.submit(cycle()).result(5) is session
+    finally:
+        query_loop.close(close_session)
+
+    # The pending tasks were cancelled and the session closed before the loop closed
+    assert all(task.cancelled() for task in background)
+    assert session.closed
+    assert query_loop.thread is None